@@ -0,0 +1,278 @@
+"""
+Bulk backfill of the strategy indexes, e.g. to bootstrap a new cluster or a new index version,
+without replaying the references one by one through the consumer.
+
+References are streamed from JSONL or Parquet files (local or bucket paths, globs allowed). A JSONL line,
+or the "reference" column of a Parquet row, may be a reference, an AMQP message (entity and reference_event)
+or a training data line (entity, reference_1 and reference_2).
+
+For each strategy, a new index <ES_INDEX>-<suffix> is created without replicas nor refresh, loaded with the bulk
+API (semantic texts being embedded in large batches by a process pool), then given its final settings,
+and the ES_INDEX alias is atomically moved to it : strategies keep querying ES_INDEX.
+
+The consumers must be stopped from the start of the load until the aliases are moved : their writes would go to
+the previous indexes and be missing from the new ones. Such writes are detected, and the aliases are then left
+unchanged (stop the consumers and run again with the same --suffix). Once restarted, the consumers write again
+the references recorded in their content hash registry for the previous indexes.
+
+Usage : python -m backfill data/*.jsonl [--strategies notice_semantic,title_syntactic] [--workers 4]
+                                        [--batch-size 256] [--replicas 1] [--suffix 20240101] [--no-swap]
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import fsspec
+from elasticsearch.helpers import streaming_bulk
+
+from commons.embeddings import EMBEDDINGS_DIMS, get_embeddings
+from commons.es_params import get_es_client
+from commons.models import Entity, Reference
+from strategies.registry import STRATEGY_REGISTRY, get_enabled_strategy_names
+from strategies.semantic_similarity_strategy import SemanticSimilarityStrategy
+
+# settings of the indexes while they are loaded
+LOADING_SETTINGS = {"number_of_replicas": 0, "refresh_interval": "-1"}
+DEFAULT_REFRESH_INTERVAL = "1s"
+PROGRESS_INTERVAL = 10.0
+
+
+def unconnected_strategy(name: str):
+    """
+    Strategy instance without connection nor model : only its index definition and text builder are used
+    """
+    module_path, class_name = STRATEGY_REGISTRY[name].rsplit(".", 1)
+    strategy_class = getattr(importlib.import_module(module_path), class_name)
+    return strategy_class.__new__(strategy_class)
+
+
+def parse_record(record: dict) -> Iterator[Tuple[Optional[Entity], Reference]]:
+    entity = Entity(**record["entity"]) if "entity" in record else None
+    if "reference_event" in record:
+        yield entity, Reference(**record["reference_event"]["reference"])
+    elif "reference_1" in record:
+        yield entity, Reference(**record["reference_1"])
+        yield entity, Reference(**record["reference_2"])
+    else:
+        yield entity, Reference(**record)
+
+
+def read_records(paths: List[str]) -> Iterator[dict]:
+    for file in fsspec.open_files(paths, "rb"):
+        if file.path.endswith(".parquet"):
+            # optional dependency, only needed for Parquet inputs
+            import pyarrow.parquet as pq
+            with file as f:
+                for batch in pq.ParquetFile(f).iter_batches(columns=["reference"]):
+                    for value in batch.column("reference").to_pylist():
+                        yield json.loads(value) if isinstance(value, (str, bytes)) else value
+        else:
+            with file as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def read_references(paths: List[str]) -> Iterator[Tuple[Optional[Entity], Reference]]:
+    # references of the training data appear in many lines : each one is loaded once
+    seen = set()
+    for record in read_records(paths):
+        for entity, reference in parse_record(record):
+            if reference.unique_identifier() in seen:
+                continue
+            seen.add(reference.unique_identifier())
+            yield entity, reference
+
+
+def _embed(texts: List[str]) -> List[List[float]]:
+    # runs in the pool workers, each one loading the model once
+    return get_embeddings().embed_documents(texts)
+
+
+class Backfill:
+    def __init__(self, strategy_names: List[str], suffix: str, workers: int, batch_size: int, chunk_size: int):
+        self.es = get_es_client()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.suffix = suffix
+        self.strategies = {name: unconnected_strategy(name) for name in strategy_names}
+        self.targets = {name: f"{strategy.ES_INDEX}-{self.suffix}" for name, strategy in self.strategies.items()}
+        self.references = 0
+        self.indexed: Dict[str, int] = {name: 0 for name in strategy_names}
+        self.errors = 0
+        self.start = None
+        self._last_progress = 0.0
+        self._created = set()
+        # documents written to the indexes behind the aliases, when the load started
+        self._live_writes: Dict[str, int] = {}
+
+    def _is_semantic(self, name: str) -> bool:
+        return isinstance(self.strategies[name], SemanticSimilarityStrategy)
+
+    def _create_index(self, name: str, dims: int = None) -> None:
+        strategy = self.strategies[name]
+        target = self.targets[name]
+        if target in self._created:
+            return
+        self._created.add(target)
+        if self.es.indices.exists(index=target):
+            return
+        if self._is_semantic(name):
+            if dims != EMBEDDINGS_DIMS:
+                raise ValueError(f"Vectors of {dims} dimensions, {EMBEDDINGS_DIMS} expected by the index template")
+            # the mapping comes from the index template of the strategy
+            strategy.put_index_template(self.es)
+            self.es.indices.create(index=target, settings=LOADING_SETTINGS)
+        else:
+            self.es.indices.create(index=target, mappings=strategy.ES_INDEX_MAPPING,
+                                   settings=strategy.ES_INDEX_SETTINGS | LOADING_SETTINGS)
+        print(f"Index {target} created for {name}")
+
+    @staticmethod
+    def _document(reference: Reference) -> dict:
+        return reference.dict() | {"id": reference.unique_identifier(), "content_hash": reference.content_hash()}
+
+    def _syntactic_actions(self, batch: List[Tuple[Optional[Entity], Reference]]) -> Iterator[dict]:
+        names = [name for name in self.strategies if not self._is_semantic(name)]
+        for name in names:
+            self._create_index(name)
+        for _, reference in batch:
+            reference.compute_last_names()
+            document = self._document(reference)
+            for name in names:
+                yield {"_index": self.targets[name], "_id": reference.unique_identifier(), "_source": document}
+
+    def _semantic_actions(self, name: str, batch, vectors: List[List[float]], texts: List[str]) -> Iterator[dict]:
+        self._create_index(name, dims=len(vectors[0]))
+        for (_, reference), vector, text in zip(batch, vectors, texts):
+            yield {"_index": self.targets[name], "_id": reference.unique_identifier(),
+                   "_source": {"text": text, "vector": vector, "metadata": self._document(reference)}}
+
+    def _batches(self, paths: List[str]) -> Iterator[List[Tuple[Optional[Entity], Reference]]]:
+        batch = []
+        for entity, reference in read_references(paths):
+            if entity is None and not reference.contributions:
+                entity = Entity(identifiers=[], name="")
+            batch.append((entity, reference))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def actions(self, paths: List[str], executor: ProcessPoolExecutor) -> Iterator[dict]:
+        """
+        Bulk actions of all the target indexes, the embeddings of at most 2 batches per worker being in flight
+        """
+        semantic_names = [name for name in self.strategies if self._is_semantic(name)]
+        in_flight = deque()
+        for batch in self._batches(paths):
+            self.references += len(batch)
+            yield from self._syntactic_actions(batch)
+            for name in semantic_names:
+                texts = [self.strategies[name]._build_text(entity, reference) for entity, reference in batch]
+                in_flight.append((name, batch, texts, executor.submit(_embed, texts)))
+            while len(in_flight) > 2 * self.workers:
+                name, done_batch, texts, future = in_flight.popleft()
+                yield from self._semantic_actions(name, done_batch, future.result(), texts)
+        while in_flight:
+            name, done_batch, texts, future = in_flight.popleft()
+            yield from self._semantic_actions(name, done_batch, future.result(), texts)
+
+    def _progress(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        elapsed = now - self.start
+        documents = sum(self.indexed.values())
+        print(f"{self.references} references read, {documents} documents indexed, {self.errors} errors, "
+              f"{self.references / elapsed:.0f} references/s, {documents / elapsed:.0f} documents/s "
+              f"({', '.join(f'{name}: {count}' for name, count in self.indexed.items())})")
+
+    def _writes(self, alias: str) -> Optional[int]:
+        """
+        Documents written to the primary shards of the indexes behind the alias, None if there is no such index
+        """
+        if not self.es.indices.exists(index=alias):
+            return None
+        indices = self.es.indices.stats(index=alias, metric="indexing")["indices"]
+        return sum(indices[index]["primaries"]["indexing"]["index_total"] for index in indices)
+
+    def load(self, paths: List[str]) -> None:
+        self._live_writes = {strategy.ES_INDEX: self._writes(strategy.ES_INDEX)
+                             for strategy in self.strategies.values()}
+        self.start = time.perf_counter()
+        index_to_name = {target: name for name, target in self.targets.items()}
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            for ok, item in streaming_bulk(self.es, self.actions(paths, executor), chunk_size=self.chunk_size,
+                                           raise_on_error=False, raise_on_exception=False):
+                result = item["index"]
+                if ok:
+                    self.indexed[index_to_name[result["_index"]]] += 1
+                else:
+                    self.errors += 1
+                    print(f"Error indexing {result.get('_id')} in {result.get('_index')}: {result.get('error')}")
+                self._progress()
+        self._progress(force=True)
+
+    def finalize(self, replicas: int) -> None:
+        for target in self.targets.values():
+            if not self.es.indices.exists(index=target):
+                continue
+            self.es.indices.put_settings(index=target, settings={"number_of_replicas": replicas,
+                                                                 "refresh_interval": DEFAULT_REFRESH_INTERVAL})
+            self.es.indices.refresh(index=target)
+
+    def swap_aliases(self, delete_concrete_index: bool) -> None:
+        for name, target in self.targets.items():
+            alias = self.strategies[name].ES_INDEX
+            if not self.es.indices.exists(index=target):
+                continue
+            if self._writes(alias) != self._live_writes.get(alias):
+                print(f"Documents written to {alias} during the load, alias left unchanged : "
+                      f"stop the consumers and run again with --suffix {self.suffix}")
+                continue
+            actions = [{"add": {"index": target, "alias": alias}}]
+            if self.es.indices.exists_alias(name=alias):
+                previous = list(self.es.indices.get_alias(name=alias))
+                actions = [{"remove": {"index": index, "alias": alias}} for index in previous] + actions
+                print(f"Alias {alias} moved from {previous} to {target}, previous indexes are kept")
+            elif self.es.indices.exists(index=alias):
+                if not delete_concrete_index:
+                    print(f"{alias} is an index, not an alias : run again with --delete-concrete-index "
+                          f"to replace it with an alias to {target}")
+                    continue
+                actions = [{"remove_index": {"index": alias}}] + actions
+                print(f"Index {alias} replaced by an alias to {target}")
+            self.es.indices.update_aliases(actions=actions)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk backfill of the strategy indexes")
+    parser.add_argument("paths", nargs="+", help="JSONL or Parquet files, local or bucket paths, globs allowed")
+    parser.add_argument("--strategies", default=",".join(get_enabled_strategy_names()))
+    parser.add_argument("--suffix", default=datetime.now().strftime("%Y%m%d%H%M%S"))
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--batch-size", type=int, default=256, help="references per embedding batch")
+    parser.add_argument("--chunk-size", type=int, default=500, help="documents per bulk request")
+    parser.add_argument("--replicas", type=int, default=1, help="replicas of the indexes once loaded")
+    parser.add_argument("--no-swap", action="store_true", help="leave the aliases unchanged")
+    parser.add_argument("--delete-concrete-index", action="store_true",
+                        help="replace strategy indexes that are not aliases yet, deleting them")
+    args = parser.parse_args()
+    backfill = Backfill([name.strip() for name in args.strategies.split(",") if name.strip()], args.suffix,
+                        args.workers, args.batch_size, args.chunk_size)
+    backfill.load(args.paths)
+    backfill.finalize(args.replicas)
+    if not args.no_swap:
+        backfill.swap_aliases(args.delete_concrete_index)
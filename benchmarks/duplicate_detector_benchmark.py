@@ -0,0 +1,70 @@
+"""
+Pairwise SimpleDuplicateDetector vs BatchDuplicateDetector on synthetic candidate lists.
+
+Candidates are random variations of the reference (shared identifiers, titles, abstracts, contributors...),
+so that every branch of the duplicate rules is exercised. Verdicts of both implementations are checked for equality.
+
+Usage : python -m benchmarks.duplicate_detector_benchmark [--sizes 10 100 1000] [--seed 0]
+"""
+import argparse
+import random
+import time
+
+from commons.models import Reference
+from simple_duplicate_detector import SimpleDuplicateDetector, BatchDuplicateDetector
+
+TITLES = ["Deep learning for retrieval", "Deep Learning for Retrieval !", "Histoire de l'Europe médiévale",
+          "Préface", "Introduction"]
+ABSTRACTS = ["An abstract.", "An  abstract", "Un résumé."]
+NAMES = ["John Smith", "Jöhn Smith", "Marie Curie", "Pierre Curie", "Ada Lovelace"]
+DOCUMENT_TYPES = ["Article", "Book", "Chapter"]
+
+
+def random_reference(rng: random.Random, index: int) -> Reference:
+    book = None
+    if rng.random() < 0.3:
+        book = {"isbn13": rng.choice([None, "978-2-07", " 978-2-07 ", "978-3-16"]),
+                "isbn10": rng.choice([None, "2-07", "3-16"])}
+    return Reference(
+        source_identifier=f"ref-{index}",
+        harvester=rng.choice(["hal", "ScanR", "Idref"]),
+        identifiers=[{"type": rng.choice(["doi", "uri", "nnt"]),
+                      "value": rng.choice(["10.1/abc", "https://doi.org/10.1/ABC", "http://a.org/x/id",
+                                           f"unique-{index}"])}
+                     for _ in range(rng.randint(0, 2))],
+        manifestations=[{"page": rng.choice(["http://a.org/x", f"http://b.org/{index}"])}
+                        for _ in range(rng.randint(0, 1))],
+        titles=[{"value": rng.choice(TITLES), "language": None} for _ in range(rng.randint(1, 2))],
+        subtitles=[],
+        abstracts=[{"value": rng.choice(ABSTRACTS), "language": None} for _ in range(rng.randint(0, 1))],
+        subjects=[],
+        document_type=[{"uri": label, "label": label} for label in rng.sample(DOCUMENT_TYPES, rng.randint(0, 2))],
+        contributions=[{"rank": rank, "role": "Author",
+                        "contributor": {"source": "s", "source_identifier": None, "name": name, "name_variants": []}}
+                       for rank, name in enumerate(rng.sample(NAMES, rng.randint(1, 3)))],
+        book=book,
+    )
+
+
+def run(size: int, rng: random.Random) -> None:
+    reference = random_reference(rng, -1)
+    candidates = [random_reference(rng, index) for index in range(size)]
+    start = time.perf_counter()
+    pairwise = [SimpleDuplicateDetector(reference, candidate).is_duplicate() for candidate in candidates]
+    pairwise_duration = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = BatchDuplicateDetector(reference).are_duplicates(candidates)
+    batch_duration = time.perf_counter() - start
+    assert [bool(verdict) for verdict in pairwise] == batch, "batch verdicts differ from pairwise verdicts"
+    print(f"{size:>6} candidates, {sum(batch):>5} duplicates : pairwise {pairwise_duration * 1000:8.2f} ms, "
+          f"batch {batch_duration * 1000:8.2f} ms ({pairwise_duration / batch_duration:.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Duplicate detection benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        run(size, rng)
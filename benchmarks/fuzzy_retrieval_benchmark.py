@@ -0,0 +1,73 @@
+"""
+Title retrieval benchmark : ES fuzzy query vs trigram retrieval with a local edit distance check.
+
+Titles are sampled from the title_syntactic_1 index (which must have been created with the trigram subfield)
+and slightly altered, then searched with both retrieval modes of the title syntactic strategy.
+Reports the latency of both modes, and the recall of the trigram mode against the fuzzy query results.
+
+Usage : python -m benchmarks.fuzzy_retrieval_benchmark [--titles 200] [--edits 0 1 2] [--seed 0]
+"""
+import argparse
+import random
+import time
+from statistics import median, quantiles
+
+from strategies.title_syntactic_similarity_strategy import TitleSyntacticSimilarityStrategy
+
+
+def sample_titles(strategy: TitleSyntacticSimilarityStrategy, count: int, seed: int):
+    response = strategy.es.search(index=strategy.ES_INDEX, body={
+        "size": count,
+        "_source": ["titles"],
+        "query": {"function_score": {"query": {"match_all": {}}, "random_score": {"seed": seed, "field": "_seq_no"}}},
+    })
+    return [title["value"] for hit in response["hits"]["hits"] for title in hit["_source"].get("titles", [])[:1]]
+
+
+def alter(title: str, edits: int, rng: random.Random) -> str:
+    for _ in range(edits):
+        position = rng.randrange(len(title))
+        title = title[:position] + rng.choice("abcdefghijklmnopqrstuvwxyz") + title[position + 1:]
+    return title
+
+
+def search(strategy: TitleSyntacticSimilarityStrategy, mode: str, title: str, size: int):
+    strategy.retrieval_mode = mode
+    start = time.perf_counter()
+    analyzed_title = strategy.es.indices.analyze(index=strategy.ES_INDEX, body={
+        "analyzer": "custom_analyzer", "text": title})["tokens"][0]["token"]
+    hits = strategy._search_hits(strategy.title_only_query(analyzed_title), size)
+    if strategy._uses_ngrams(analyzed_title):
+        hits = strategy._within_levenshtein_threshold(title, hits)
+    return time.perf_counter() - start, {hit["_id"] for hit in hits}
+
+
+def run(strategy: TitleSyntacticSimilarityStrategy, titles, edits: int, size: int, rng: random.Random) -> None:
+    durations = {"fuzzy": [], "ngram": []}
+    found, expected = 0, 0
+    for title in titles:
+        title = alter(title, edits, rng)
+        fuzzy_duration, fuzzy_ids = search(strategy, "fuzzy", title, size)
+        ngram_duration, ngram_ids = search(strategy, "ngram", title, size)
+        durations["fuzzy"].append(fuzzy_duration)
+        durations["ngram"].append(ngram_duration)
+        expected += len(fuzzy_ids)
+        found += len(fuzzy_ids & ngram_ids)
+    for mode, values in durations.items():
+        print(f"{edits} edits, {mode:>5} : median {median(values) * 1000:8.2f} ms, "
+              f"p95 {quantiles(values, n=20)[-1] * 1000:8.2f} ms")
+    print(f"{edits} edits, trigram recall against fuzzy : {found / expected if expected else 1:.3f} "
+          f"({found}/{expected} hits)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Title retrieval benchmark")
+    parser.add_argument("--titles", type=int, default=200)
+    parser.add_argument("--edits", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--size", type=int, default=TitleSyntacticSimilarityStrategy.NGRAM_SEARCH_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    title_strategy = TitleSyntacticSimilarityStrategy()
+    sampled_titles = [title for title in sample_titles(title_strategy, args.titles, args.seed) if title]
+    for edit_count in args.edits:
+        run(title_strategy, sampled_titles, edit_count, args.size, random.Random(args.seed))
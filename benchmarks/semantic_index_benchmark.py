@@ -0,0 +1,75 @@
+"""
+Semantic index benchmark : recall and latency of approximate kNN search on two indexes holding the same vectors,
+typically the current index (default HNSW, float vectors) and an index created from the strategy template
+(int8 HNSW, see python -m backfill).
+
+Query vectors are sampled from the baseline index. The exact nearest neighbours are computed on the baseline index
+with a script_score query, and the recall@k of both indexes is measured against them,
+for each value of num_candidates.
+
+Usage : python -m benchmarks.semantic_index_benchmark notices_semantic_minilml12v2_1 \
+            notices_semantic_minilml12v2_1-20240101 [--queries 100] [--k 20] [--num-candidates 20 50 100 200]
+"""
+import argparse
+import time
+from statistics import median, quantiles
+
+from commons.es_params import get_es_client
+
+
+def sample_vectors(es, index: str, count: int, seed: int):
+    response = es.search(index=index, size=count, source=["vector"], query={
+        "function_score": {"query": {"match_all": {}}, "random_score": {"seed": seed, "field": "_seq_no"}}})
+    return [hit["_source"]["vector"] for hit in response["hits"]["hits"]]
+
+
+def exact_neighbours(es, index: str, vector, k: int) -> set:
+    response = es.search(index=index, size=k, source=False, query={
+        "script_score": {
+            "query": {"match_all": {}},
+            "script": {"source": "cosineSimilarity(params.vector, 'vector') + 1.0", "params": {"vector": vector}},
+        }})
+    return {hit["_id"] for hit in response["hits"]["hits"]}
+
+
+def approximate_neighbours(es, index: str, vector, k: int, num_candidates: int):
+    start = time.perf_counter()
+    response = es.search(index=index, size=k, source=False,
+                         knn={"field": "vector", "query_vector": vector, "k": k, "num_candidates": num_candidates})
+    # server side duration, the client round trip being the same for both indexes
+    return {hit["_id"] for hit in response["hits"]["hits"]}, response["took"] / 1000, time.perf_counter() - start
+
+
+def run(es, indexes, vectors, k: int, num_candidates: int) -> None:
+    truths = [exact_neighbours(es, indexes[0], vector, k) for vector in vectors]
+    for index in indexes:
+        found, expected, took, durations = 0, 0, [], []
+        for vector, truth in zip(vectors, truths):
+            ids, server_duration, duration = approximate_neighbours(es, index, vector, k, num_candidates)
+            found += len(ids & truth)
+            expected += len(truth)
+            took.append(server_duration)
+            durations.append(duration)
+        print(f"{index} num_candidates={num_candidates:<4} recall@{k} {found / expected if expected else 1:.3f}, "
+              f"took median {median(took) * 1000:6.1f} ms p95 {quantiles(took, n=20)[-1] * 1000:6.1f} ms, "
+              f"round trip median {median(durations) * 1000:6.1f} ms")
+    for index in indexes:
+        stats = es.indices.stats(index=index, metric=["store", "docs"])["indices"]
+        for name, index_stats in stats.items():
+            print(f"{name} : {index_stats['primaries']['docs']['count']} documents, "
+                  f"{index_stats['primaries']['store']['size_in_bytes'] / 2 ** 20:.0f} MiB on disk (primaries)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Semantic index recall / latency benchmark")
+    parser.add_argument("baseline", help="index used for the query vectors and the exact neighbours")
+    parser.add_argument("candidates", nargs="+", help="indexes to compare with the baseline")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[20, 50, 100, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    client = get_es_client()
+    query_vectors = sample_vectors(client, args.baseline, args.queries, args.seed)
+    for candidates_count in args.num_candidates:
+        run(client, [args.baseline] + args.candidates, query_vectors, args.k, max(candidates_count, args.k))
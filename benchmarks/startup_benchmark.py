@@ -0,0 +1,62 @@
+"""
+Startup time benchmark.
+
+Measures, in fresh interpreters :
+- the time needed to import the main module (what delays the health server),
+- the time needed to build all similarity strategies sequentially (former eager behaviour)
+  and in parallel through the strategy registry.
+
+Usage : python -m benchmarks.startup_benchmark [--runs N] [--output results.jsonl]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from datetime import datetime
+from statistics import median
+
+IMPORT_MAIN_SNIPPET = """
+import time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start)
+"""
+
+BUILD_STRATEGIES_SNIPPET = """
+import time
+from strategies.registry import StrategyRegistry
+registry = StrategyRegistry(max_workers={max_workers})
+start = time.perf_counter()
+registry.initialize()
+print(time.perf_counter() - start)
+"""
+
+
+def _time_snippet(snippet: str) -> float:
+    output = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def run(runs: int) -> dict:
+    import_times = [_time_snippet(IMPORT_MAIN_SNIPPET) for _ in range(runs)]
+    sequential_times = [_time_snippet(BUILD_STRATEGIES_SNIPPET.format(max_workers=1)) for _ in range(runs)]
+    parallel_times = [_time_snippet(BUILD_STRATEGIES_SNIPPET.format(max_workers=None)) for _ in range(runs)]
+    return {
+        "date": datetime.now().isoformat(),
+        "runs": runs,
+        "import_main_s": median(import_times),
+        "strategies_sequential_s": median(sequential_times),
+        "strategies_parallel_s": median(parallel_times),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Startup time benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="JSONL file to which results are appended, to track them over time")
+    args = parser.parse_args()
+    results = run(args.runs)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(results) + "\n")
@@ -0,0 +1,94 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Type
+
+from commons.models import Reference, Result
+
+
+class MissingIdrefNntFilter:
+    """
+    If one of the references is a thesis from ScanR, with nnt, and the other is from Idref, without nnt,
+    but with sudoc equivalent, discard the candidate,
+    as the idref group notices does not copy the nnt identifier from sudoc
+    """
+
+    def __init__(self, candidate: Result):
+        self.candidate = candidate
+
+    def discard(self) -> bool:
+        reference1 = self.candidate.reference1
+        reference2 = self.candidate.reference2
+        if not (reference1.harvester == 'Idref' and reference2.harvester == 'ScanR') and not (
+                reference1.harvester == 'ScanR' and reference2.harvester == 'Idref'):
+            return False
+        ref1 = reference1 if reference1.harvester == 'Idref' else reference2
+        ref2 = reference2 if reference2.harvester == 'ScanR' else reference1
+        assert ref1.harvester == 'Idref'
+        assert ref2.harvester == 'ScanR'
+        assert not ref1.source_identifier == ref2.source_identifier
+        # ref1 comes from idref, ref2 from scanr
+        if not ref1.source_identifier.startswith('http://www.idref.fr/'):
+            return False
+        if not ref2.source_identifier.startswith('nnt'):
+            return False
+        # ref1 is missing nnt
+        return not any(identifier.type == 'nnt' for identifier in ref1.identifiers)
+
+
+# harvester-specific rules applied to the candidates before they are written out
+CANDIDATE_FILTERS = [MissingIdrefNntFilter]
+
+
+class CandidateSet:
+    """
+    Candidates of a reference, keyed by the unique identifier of the candidate reference.
+
+    Results of several strategies for the same candidate are merged : strategy names and scores are concatenated.
+    """
+
+    def __init__(self, reference: Reference, results: Iterable[Result] = ()):
+        self.reference = reference
+        self._candidates: Dict[str, Result] = {}
+        self.update(results)
+
+    def add(self, result: Result) -> None:
+        key = result.reference2.unique_identifier()
+        if key in self._candidates:
+            self._candidates[key].similarity_strategies += result.similarity_strategies
+            self._candidates[key].scores += result.scores
+        else:
+            self._candidates[key] = result
+
+    def update(self, results: Iterable[Result]) -> None:
+        for result in results:
+            self.add(result)
+
+    def discard_where(self, predicate: Callable[[Result], bool]) -> List[Result]:
+        """
+        Remove the candidates matching the predicate
+
+        :return: the removed candidates
+        """
+        discarded = [key for key, candidate in self._candidates.items() if predicate(candidate)]
+        return [self._candidates.pop(key) for key in discarded]
+
+    def apply_filters(self, filters: List[Type] = None) -> List[Result]:
+        """
+        Remove the candidates discarded by any of the filters (classes taking a candidate, with a discard method)
+        """
+        filters = CANDIDATE_FILTERS if filters is None else filters
+        return self.discard_where(lambda candidate: any(candidate_filter(candidate).discard()
+                                                        for candidate_filter in filters))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._candidates
+
+    def __getitem__(self, key: str) -> Result:
+        return self._candidates[key]
+
+    def __iter__(self) -> Iterator[Result]:
+        return iter(list(self._candidates.values()))
+
+    def __len__(self) -> int:
+        return len(self._candidates)
+
+    def items(self):
+        return self._candidates.items()
@@ -0,0 +1,95 @@
+import atexit
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import streaming_bulk
+
+from commons.tracing import span
+
+DEFAULT_FLUSH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class BulkIndexer:
+    """
+    Buffers documents and writes them to an index with the bulk API,
+    when flush_size documents are pending or every flush_interval seconds.
+
+    on_indexed callbacks are only called once the document has actually been accepted by ES.
+    """
+
+    def __init__(self, es: Elasticsearch, index: str, flush_size: int = None, flush_interval: float = None):
+        self.es = es
+        self.index = index
+        self.flush_size = flush_size or int(os.getenv("BULK_FLUSH_SIZE", DEFAULT_FLUSH_SIZE))
+        self.flush_interval = flush_interval if flush_interval is not None \
+            else float(os.getenv("BULK_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL))
+        self.indexed = 0
+        self.errors = 0
+        self._pending: Dict[str, Tuple[dict, Optional[Callable[[], None]]]] = {}
+        # documents written since the last refresh requested by this indexer
+        self._unrefreshed = False
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        if self.flush_interval > 0:
+            threading.Thread(target=self._flush_periodically, name=f"bulk-indexer-{index}", daemon=True).start()
+        atexit.register(self.close)
+
+    def add(self, identifier: str, document: dict, on_indexed: Callable[[], None] = None) -> None:
+        with self._lock:
+            # a newer version of a pending document replaces the older one
+            self._pending[identifier] = (document, on_indexed)
+            if len(self._pending) >= self.flush_size:
+                self.flush()
+
+    def is_pending(self, identifier: str) -> bool:
+        with self._lock:
+            return identifier in self._pending
+
+    def flush(self, refresh: bool | str = False) -> None:
+        """
+        Write all pending documents.
+
+        :param refresh: False, True or "wait_for" : passed to the bulk API to make the written documents searchable,
+        the index being only refreshed without pending documents if some were written since the last refresh
+        """
+        with self._lock:
+            if not self._pending:
+                if refresh and self._unrefreshed:
+                    with span("es.refresh", index=self.index):
+                        self.es.indices.refresh(index=self.index)
+                    self._unrefreshed = False
+                return
+            pending, self._pending = self._pending, {}
+            actions = [{"_index": self.index, "_id": identifier, "_source": document}
+                       for identifier, (document, _) in pending.items()]
+            succeeded: List[str] = []
+            with span("es.bulk", index=self.index, documents=len(actions)):
+                try:
+                    for ok, item in streaming_bulk(self.es, actions, refresh=refresh, raise_on_error=False,
+                                                   raise_on_exception=False, chunk_size=self.flush_size):
+                        result = item["index"]
+                        if ok:
+                            succeeded.append(result["_id"])
+                        else:
+                            self.errors += 1
+                            print(f"Error indexing {result.get('_id')} in {self.index}: {result.get('error')}")
+                except Exception as e:
+                    self.errors += len(actions) - len(succeeded)
+                    print(f"Error flushing {len(actions)} documents to {self.index}: {e}")
+            self.indexed += len(succeeded)
+            self._unrefreshed = not refresh
+        for identifier in succeeded:
+            on_indexed = pending[identifier][1]
+            if on_indexed:
+                on_indexed()
+
+    def _flush_periodically(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self.flush()
@@ -0,0 +1,243 @@
+"""
+Record / replay of the Elasticsearch exchanges and AMQP deliveries of a consumer, to reproduce a production run
+offline (see python -m replay).
+The transports of the ES client are in commons.cassette_transport, imported with the client only.
+
+With CASSETTE_MODE=record, every ES request of the shared client (its response, status and duration) and every
+consumed message (routing key and body) is appended to CASSETTE_FILE, a gzipped JSONL file. Request bodies are
+only kept as a hash, used to match the requests on replay.
+
+With CASSETTE_MODE=replay, the shared client is given a transport that never connects : each request is answered
+with the next recorded response of the same method, target and body (the last one once they are exhausted),
+after the recorded duration scaled by CASSETTE_LATENCY ("original", "none" or a factor). Bulk writes are
+acknowledged without being recorded, so that documents may be batched differently than during the recording.
+"""
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_CASSETTE_FILE = "cassettes/cassette.jsonl.gz"
+
+
+class CassetteMiss(LookupError):
+    """
+    Request absent from the cassette being replayed
+    """
+
+
+def latency_factor(value: str = None) -> float:
+    value = value or os.getenv("CASSETTE_LATENCY", "original")
+    if value == "original":
+        return 1.0
+    if value == "none":
+        return 0.0
+    return float(value)
+
+
+def _without_vectors(value):
+    # query vectors may differ in their last bits from one machine to another : they are not part of the match
+    if isinstance(value, dict):
+        return {key: "<vector>" if key == "query_vector" else _without_vectors(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_without_vectors(item) for item in value]
+    return value
+
+
+def _canonical(body) -> str:
+    if body is None:
+        return ""
+    if isinstance(body, (list, tuple)):
+        return "\n".join(_canonical(line) for line in body)
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return body
+    return json.dumps(_without_vectors(body), sort_keys=True, default=str)
+
+
+def request_key(method: str, target: str, body) -> str:
+    return hashlib.sha1(f"{method} {target}\n{_canonical(body)}".encode("utf-8")).hexdigest()
+
+
+def _is_bulk(target: str) -> bool:
+    return target.split("?", 1)[0].endswith("/_bulk")
+
+
+def _encode_body(body) -> dict:
+    if body is None:
+        return {}
+    if isinstance(body, bytes):
+        return {"bytes": base64.b64encode(body).decode("ascii")}
+    if isinstance(body, str):
+        return {"text": body}
+    return {"json": body}
+
+
+def _decode_body(entry: dict):
+    if "bytes" in entry:
+        return base64.b64decode(entry["bytes"])
+    if "text" in entry:
+        return entry["text"]
+    return entry.get("json")
+
+
+def bulk_response(target: str, body) -> dict:
+    """
+    Successful response to a bulk request, one item per operation
+    """
+    default_index = target.split("?", 1)[0].strip("/").split("/")[0] if not target.startswith("/_bulk") else None
+    lines = body if isinstance(body, (list, tuple)) else [line for line in _canonical(body).splitlines() if line]
+    items = []
+    expects_source = False
+    for line in lines:
+        if expects_source:
+            expects_source = False
+            continue
+        if isinstance(line, (bytes, str)):
+            line = json.loads(line)
+        operation = next(iter(line))
+        metadata = line[operation] or {}
+        items.append({operation: {"_index": metadata.get("_index", default_index), "_id": metadata.get("_id"),
+                                  "status": 201 if operation in ("index", "create") else 200,
+                                  "result": "created" if operation in ("index", "create") else "updated"}})
+        expects_source = operation != "delete"
+    return {"took": 0, "errors": False, "items": items}
+
+
+class CassetteRecorder:
+    """
+    Appends the interactions to the cassette, flushing each one so that an interrupted recording stays readable
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("CASSETTE_FILE", DEFAULT_CASSETTE_FILE)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = gzip.open(self.path, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self.recorded = 0
+        atexit.register(self.close)
+
+    def _append(self, entry: dict) -> None:
+        line = json.dumps(entry | {"t": round(time.monotonic() - self._start, 6)}, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+    def record_es(self, method: str, target: str, body, meta, response,
+                  error: Exception = None, duration: float = 0.0) -> None:
+        entry = {"kind": "es", "key": request_key(method, target, body), "method": method,
+                 "target": target, "duration": round(duration, 6)}
+        if error is not None:
+            entry["error"] = {"type": type(error).__name__, "message": str(error)}
+        elif _is_bulk(target):
+            # acknowledged on replay, only the duration is kept
+            entry["status"] = meta.status
+        else:
+            entry |= {"status": meta.status, "http_version": meta.http_version,
+                      "headers": dict(meta.headers), "body": _encode_body(response)}
+        self._append(entry)
+
+    def record_message(self, routing_key: str, body: bytes) -> None:
+        self._append({"kind": "amqp", "routing_key": routing_key or "", "body": _encode_body(body)})
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class CassettePlayer:
+    """
+    Recorded interactions, served in their recording order for each request
+    """
+
+    def __init__(self, path: str = None, latency: float = None):
+        self.path = path or os.getenv("CASSETTE_FILE", DEFAULT_CASSETTE_FILE)
+        self.latency = latency if latency is not None else latency_factor()
+        self.messages: List[Tuple[float, str, bytes]] = []
+        self._responses: Dict[str, Deque[dict]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.missed = 0
+        bulk_durations = []
+        for entry in self._entries():
+            if entry["kind"] == "amqp":
+                self.messages.append((entry["t"], entry["routing_key"], _decode_body(entry["body"])))
+            elif _is_bulk(entry["target"]):
+                bulk_durations.append(entry["duration"])
+            else:
+                self._responses[entry["key"]].append(entry)
+        # bulk requests are not matched : they all take the mean recorded duration
+        self.bulk_duration = sum(bulk_durations) / len(bulk_durations) if bulk_durations else 0.0
+
+    def _entries(self) -> Iterator[dict]:
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            except (EOFError, ValueError):
+                # recording interrupted in the middle of a line
+                pass
+
+    def response(self, method: str, target: str, body) -> dict:
+        key = request_key(method, target, body)
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                self.missed += 1
+                raise CassetteMiss(f"{method} {target} is not in the cassette {self.path}")
+            self.served += 1
+            # the last response of a request is served again once the others are exhausted
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+    def stats(self) -> dict:
+        return {"messages": len(self.messages), "requests": sum(len(entries) for entries in self._responses.values()),
+                "served": self.served, "missed": self.missed}
+
+
+def cassette_mode() -> Optional[str]:
+    mode = os.getenv("CASSETTE_MODE", "").lower()
+    return mode if mode in ("record", "replay") else None
+
+
+_recorder = None
+_player = None
+_lock = threading.Lock()
+
+
+def get_recorder() -> Optional[CassetteRecorder]:
+    """
+    Process-wide cassette recorder, None unless CASSETTE_MODE=record
+    """
+    global _recorder
+    if cassette_mode() != "record":
+        return None
+    with _lock:
+        if _recorder is None:
+            _recorder = CassetteRecorder()
+        return _recorder
+
+
+def get_player() -> Optional[CassettePlayer]:
+    """
+    Process-wide cassette player, None unless CASSETTE_MODE=replay
+    """
+    global _player
+    if cassette_mode() != "replay":
+        return None
+    with _lock:
+        if _player is None:
+            _player = CassettePlayer()
+        return _player
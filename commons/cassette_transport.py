@@ -0,0 +1,51 @@
+"""
+Elasticsearch transports recording the exchanges of the shared client to the cassette, or replaying them from it
+"""
+import time
+from typing import Optional
+
+import elastic_transport
+from elastic_transport import ApiResponseMeta, HttpHeaders, Transport, TransportApiResponse, TransportError
+
+from commons.cassette import _decode_body, _is_bulk, bulk_response, cassette_mode, get_player, get_recorder
+
+
+class RecordingTransport(Transport):
+    def perform_request(self, method: str, target: str, *, body=None, **kwargs) -> TransportApiResponse:
+        recorder = get_recorder()
+        start = time.perf_counter()
+        try:
+            meta, response = super().perform_request(method, target, body=body, **kwargs)
+        except TransportError as e:
+            recorder.record_es(method, target, body, None, None, error=e, duration=time.perf_counter() - start)
+            raise
+        recorder.record_es(method, target, body, meta, response, duration=time.perf_counter() - start)
+        return TransportApiResponse(meta, response)
+
+
+class ReplayTransport(Transport):
+    def perform_request(self, method: str, target: str, *, body=None, **kwargs) -> TransportApiResponse:
+        player = get_player()
+        node = self.node_pool.all()[0].config
+        if _is_bulk(target):
+            if player.latency:
+                time.sleep(player.bulk_duration * player.latency)
+            headers = HttpHeaders({"content-type": "application/json", "x-elastic-product": "Elasticsearch"})
+            return TransportApiResponse(ApiResponseMeta(200, "1.1", headers, player.bulk_duration, node),
+                                        bulk_response(target, body))
+        entry = player.response(method, target, body)
+        if player.latency:
+            time.sleep(entry["duration"] * player.latency)
+        if "error" in entry:
+            error_class = getattr(elastic_transport, entry["error"]["type"], TransportError)
+            raise error_class(entry["error"]["message"])
+        meta = ApiResponseMeta(entry["status"], entry["http_version"], HttpHeaders(entry["headers"]),
+                               entry["duration"], node)
+        return TransportApiResponse(meta, _decode_body(entry["body"]))
+
+
+def es_transport_class() -> Optional[type]:
+    """
+    Transport class of the shared ES client in record or replay mode, None otherwise
+    """
+    return {"record": RecordingTransport, "replay": ReplayTransport}.get(cassette_mode())
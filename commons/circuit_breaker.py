@@ -0,0 +1,86 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed or slow calls.
+
+    Once open, calls are refused until a background probe succeeds after reset_timeout seconds :
+    the breaker is then half open and admits a single trial call, the others being refused until it
+    succeeds (the breaker closes) or fails (the breaker opens again).
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, slow_call_duration: float = None,
+                 reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_duration = slow_call_duration
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.rejected_calls = 0
+        # if the trial call of the half open breaker is in progress
+        self._trial_call = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN or (self.state == HALF_OPEN and self._trial_call):
+                self.rejected_calls += 1
+                return False
+            if self.state == HALF_OPEN:
+                self._trial_call = True
+            return True
+
+    def record_success(self, duration: float) -> None:
+        if self.slow_call_duration is not None and duration > self.slow_call_duration:
+            print(f"Slow call to {self.name}: {duration:.2f}s")
+            self.record_failure()
+            return
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                print(f"Circuit breaker {self.name} closed")
+            self.state = CLOSED
+            self._trial_call = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def force_open(self) -> None:
+        """
+        Open the breaker if it is not already : the reset timeout of an open breaker is not restarted
+        """
+        with self._lock:
+            if self.state != OPEN:
+                self._open()
+
+    def _open(self) -> None:
+        if self.state != OPEN:
+            print(f"Circuit breaker {self.name} opened after {self.consecutive_failures} failures")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._trial_call = False
+
+    def should_probe(self) -> bool:
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def probe_succeeded(self) -> None:
+        with self._lock:
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+                print(f"Circuit breaker {self.name} half open")
+
+    def probe_failed(self) -> None:
+        with self._lock:
+            self.opened_at = time.monotonic()
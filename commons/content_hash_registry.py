@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Optional
+
+DEFAULT_CONTENT_HASH_DB = "content_hashes.sqlite"
+
+_connection = None
+_connection_lock = threading.Lock()
+
+
+def _get_connection() -> sqlite3.Connection:
+    global _connection
+    with _connection_lock:
+        if _connection is None:
+            _connection = sqlite3.connect(os.getenv("CONTENT_HASH_DB", DEFAULT_CONTENT_HASH_DB),
+                                          check_same_thread=False)
+            _connection.execute("PRAGMA journal_mode=WAL")
+            _connection.execute("PRAGMA synchronous=NORMAL")
+            _connection.execute("CREATE TABLE IF NOT EXISTS content_hashes ("
+                                "index_name TEXT NOT NULL, identifier TEXT NOT NULL, content_hash TEXT NOT NULL, "
+                                "PRIMARY KEY (index_name, identifier))")
+            _connection.commit()
+        return _connection
+
+
+class ContentHashRegistry:
+    """
+    Content hash of the last version of each reference written to an index,
+    persisted in a local sqlite database shared by all indexes.
+
+    The hash is also stored as a field of the indexed documents, so that a consumer with an empty local registry
+    can fall back on the index itself through stored_hash_loader (CONTENT_HASH_ES_LOOKUP=true). The lookup costs
+    one ES request per unknown reference and index : it is only worth enabling while the registry is cold,
+    e.g. for a new consumer in front of a populated index.
+
+    Once bound, the hashes are scoped to the concrete index behind the alias : after a backfill moves the alias
+    (or when the index is recreated), the references written to the previous index are written again.
+    """
+
+    def __init__(self, index_name: str):
+        self.alias = index_name
+        self.index_name = index_name
+        self.enabled = os.getenv("SKIP_UNCHANGED_REFERENCES", "true").lower() == "true"
+        self.es_lookup = os.getenv("CONTENT_HASH_ES_LOOKUP", "false").lower() == "true"
+        self.skipped_writes = 0
+        self.writes = 0
+
+    def bind(self, client) -> None:
+        """
+        Scope the registry to the indexes currently behind the alias, identified by their uuid,
+        and drop the hashes recorded for the previous ones
+        """
+        try:
+            settings = client.indices.get_settings(index=self.alias, name="index.uuid")
+        except Exception as e:
+            print(f"Unable to resolve the indexes behind {self.alias}, content hashes not scoped : {e}")
+            return
+        uuids = sorted(settings[name]["settings"]["index"]["uuid"] for name in settings)
+        self.index_name = f"{self.alias}@{'+'.join(uuids)}"
+        connection = _get_connection()
+        with _connection_lock:
+            prefix = f"{self.alias}@"
+            deleted = connection.execute("DELETE FROM content_hashes WHERE (index_name = ? "
+                                         "OR substr(index_name, 1, ?) = ?) AND index_name != ?",
+                                         (self.alias, len(prefix), prefix, self.index_name)).rowcount
+            connection.commit()
+        if deleted:
+            print(f"{deleted} content hashes of previous {self.alias} indexes dropped")
+
+    def get(self, identifier: str) -> Optional[str]:
+        connection = _get_connection()
+        with _connection_lock:
+            row = connection.execute(
+                "SELECT content_hash FROM content_hashes WHERE index_name = ? AND identifier = ?",
+                (self.index_name, identifier)).fetchone()
+        return row[0] if row else None
+
+    def set(self, identifier: str, content_hash: str) -> None:
+        connection = _get_connection()
+        with _connection_lock:
+            connection.execute("INSERT OR REPLACE INTO content_hashes VALUES (?, ?, ?)",
+                               (self.index_name, identifier, content_hash))
+            connection.commit()
+
+    def is_unchanged(self, identifier: str, content_hash: str,
+                     stored_hash_loader: Callable[[], Optional[str]] = None) -> bool:
+        """
+        Whether the given version of the reference has already been written to the index.
+        Counts the avoided writes.
+        """
+        if not self.enabled:
+            return False
+        stored_hash = self.get(identifier)
+        if stored_hash is None and self.es_lookup and stored_hash_loader is not None:
+            stored_hash = stored_hash_loader()
+            if stored_hash is not None:
+                self.set(identifier, stored_hash)
+        if stored_hash != content_hash:
+            return False
+        self.skipped_writes += 1
+        print(f"Reference {identifier} unchanged in {self.alias}, "
+              f"{self.skipped_writes} writes avoided / {self.writes} writes")
+        return True
+
+    def record_write(self, identifier: str, content_hash: str) -> None:
+        self.writes += 1
+        if self.enabled:
+            self.set(identifier, content_hash)
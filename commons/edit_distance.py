@@ -0,0 +1,51 @@
+def bounded_levenshtein(a: str, b: str, max_distance: int, transpositions: bool = False) -> int:
+    """
+    Levenshtein distance between a and b if it is at most max_distance, max_distance + 1 otherwise.
+
+    With transpositions, a swap of two adjacent characters counts as one edit instead of two
+    (optimal string alignment distance), as in the Elasticsearch fuzzy query, where it is the default.
+
+    Only the diagonal band of width 2 * max_distance + 1 of the dynamic programming matrix is computed,
+    and the computation stops as soon as every cell of a row exceeds max_distance : O(max_distance * len(a)).
+    """
+    if a == b:
+        return 0
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > max_distance:
+        return max_distance + 1
+    # common prefix and suffix do not change the distance
+    start = 0
+    while start < len(a) and a[start] == b[start]:
+        start += 1
+    a, b = a[start:], b[start:]
+    while a and a[-1] == b[-1]:
+        a, b = a[:-1], b[:-1]
+    if not a:
+        return len(b)
+    over = max_distance + 1
+    before_previous = None
+    previous = [j if j <= max_distance else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        low = max(1, i - max_distance)
+        high = min(len(b), i + max_distance)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= max_distance else over
+        char = a[i - 1]
+        row_min = current[0] if low == 1 else over
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            if transpositions and before_previous is not None and j > 1 and char == b[j - 2] \
+                    and a[i - 2] == b[j - 1] and before_previous[j - 2] + 1 < cost:
+                cost = before_previous[j - 2] + 1
+            current[j] = cost if cost < over else over
+            if cost < row_min:
+                row_min = cost
+        if row_min > max_distance:
+            return over
+        before_previous, previous = previous, current
+    return previous[len(b)]
@@ -0,0 +1,33 @@
+import os
+import threading
+
+EMBEDDINGS_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+# dimension of the vectors of the model, as mapped in the semantic indexes
+EMBEDDINGS_DIMS = 384
+# "torch" (sentence-transformers through langchain) or "onnx" (int8-quantized export, see commons.onnx_embeddings)
+DEFAULT_EMBEDDINGS_BACKEND = "torch"
+
+_embeddings = {}
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings(model_name: str = EMBEDDINGS_MODEL_NAME, backend: str = None):
+    """
+    Return a process-wide embeddings instance for the given model and backend.
+
+    The model is loaded on first call only, so that both semantic strategies share the same weights.
+    The import of langchain / sentence-transformers / onnxruntime is deferred until then.
+    """
+    backend = backend or os.getenv("EMBEDDINGS_BACKEND", DEFAULT_EMBEDDINGS_BACKEND)
+    with _embeddings_lock:
+        if (backend, model_name) not in _embeddings:
+            if backend == "onnx":
+                from commons.onnx_embeddings import OnnxEmbeddings, DEFAULT_ONNX_MODEL_DIR
+                embeddings = OnnxEmbeddings(os.getenv("ONNX_MODEL_DIR", DEFAULT_ONNX_MODEL_DIR))
+            elif backend == "torch":
+                from langchain.embeddings.huggingface import HuggingFaceEmbeddings
+                embeddings = HuggingFaceEmbeddings(model_name=model_name)
+            else:
+                raise ValueError(f"Unknown embeddings backend: {backend}")
+            _embeddings[(backend, model_name)] = embeddings
+        return _embeddings[(backend, model_name)]
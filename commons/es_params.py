@@ -1,4 +1,6 @@
 import os
+import threading
+
 
 class ESParams:
     def __init__(self):
@@ -7,8 +9,65 @@ class ESParams:
         self.host = os.getenv("ES_HOST", "localhost")
         self.port = os.getenv("ES_PORT", "9200")
         self.scheme = os.getenv("ES_SCHEME", "http")
+        # transport tuning, shared by all strategies
+        self.connections_per_node = int(os.getenv("ES_CONNECTIONS_PER_NODE", 10))
+        self.http_compress = os.getenv("ES_HTTP_COMPRESS", "true").lower() == "true"
+        self.node_sniff = os.getenv("ES_NODE_SNIFF", "false").lower() == "true"
+        self.request_timeout = float(os.getenv("ES_REQUEST_TIMEOUT", 10))
 
     @property
     def url(self):
         # Construct the URL using the host and port
-        return f"{self.scheme}://{self.host}:{self.port}"
\ No newline at end of file
+        return f"{self.scheme}://{self.host}:{self.port}"
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_es_client():
+    """
+    Process-wide Elasticsearch client : a single connection pool (kept-alive connections, optional gzip
+    compression of requests and responses, optional node sniffing) shared by all strategies.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from elasticsearch import Elasticsearch
+            from commons.cassette_transport import ReplayTransport, es_transport_class
+            params = ESParams()
+            # recording or replaying transport in cassette mode
+            transport_class = es_transport_class()
+            if transport_class is ReplayTransport:
+                params.node_sniff = False
+            _client = Elasticsearch(
+                [params.url],
+                http_auth=(params.user, params.password),
+                verify_certs=False,
+                connections_per_node=params.connections_per_node,
+                http_compress=params.http_compress,
+                request_timeout=params.request_timeout,
+                sniff_on_start=params.node_sniff,
+                sniff_on_node_failure=params.node_sniff,
+                **({"transport_class": transport_class} if transport_class else {}),
+            )
+        return _client
+
+
+def connection_pool_stats() -> dict:
+    """
+    Connection pool statistics of the shared client, per node
+    """
+    if _client is None:
+        return {}
+    nodes = {}
+    for node in _client.transport.node_pool.all():
+        # urllib3 pool of the default node class
+        pool = getattr(node, "pool", None)
+        nodes[node.base_url] = {
+            "connections_per_node": getattr(node.config, "connections_per_node", None),
+            "connections_created": getattr(pool, "num_connections", None),
+            "requests": getattr(pool, "num_requests", None),
+            "available_slots": pool.pool.qsize() if pool is not None and pool.pool is not None else None,
+        }
+    return nodes
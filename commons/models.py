@@ -1,11 +1,34 @@
+import hashlib
+import json
+import os
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Optional
 
 from nameparser import HumanName
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from commons.relators import RELATOR_URI_TO_LABEL, extract_relator_code
 
+
+@lru_cache(maxsize=int(os.getenv("LAST_NAME_CACHE_SIZE", 65536)))
+def parse_last_name(name: str) -> str:
+    # process-wide memo : the same contributor names come back in many messages
+    return HumanName(name).last
+
+
+def last_name_cache_stats() -> dict:
+    info = parse_last_name.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+        "hit_rate": info.hits / lookups if lookups else None,
+    }
+
+
 class ReferenceIdentifier(BaseModel):
     type: str
     value: str
@@ -105,16 +128,27 @@ class Reference(BaseModel):
     issue: Optional[Issue] = None
     page: Optional[str] = None
     book: Optional[Book] = None
+    # set once the last names are computed, as several strategies need them for the same message
+    _last_names_computed: bool = PrivateAttr(default=False)
 
     def compute_last_names(self) -> None:
         # use HumanName to populate the last_name field of each contributor
+        if self._last_names_computed:
+            return
         for contribution in self.contributions:
             if contribution.contributor.name:
-                contribution.contributor.last_name = HumanName(contribution.contributor.name).last
+                contribution.contributor.last_name = parse_last_name(contribution.contributor.name)
+        self._last_names_computed = True
 
     def unique_identifier(self) -> str:
         return f"{self.harvester}-{self.source_identifier}"
 
+    def content_hash(self) -> str:
+        # hash of the harvested content only : computed fields are excluded
+        content = self.dict(exclude={"similarity_strategies": True,
+                                     "contributions": {"__all__": {"contributor": {"last_name"}}}})
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
     def html_comparaison_table(self, other_reference: 'Reference', strategies, scores) -> str:
         table_html = "<table class=\"duplicate-comparaison\">\n"
         table_html += "    <tr>\n"
@@ -230,6 +264,17 @@ class Reference(BaseModel):
         return table_html
 
 
+class ReferenceSummary(BaseModel):
+    """
+    Fields of an indexed reference needed to filter search hits before fetching the full reference
+    """
+    id: Optional[str] = None
+    source_identifier: str
+    identifiers: List[ReferenceIdentifier] = []
+    titles: List[Title] = []
+    content_hash: Optional[str] = None
+
+
 class EntityIdentifier(BaseModel):
     type: str
     value: str
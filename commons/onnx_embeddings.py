@@ -0,0 +1,172 @@
+"""
+int8-quantized ONNX version of paraphrase-multilingual-MiniLM-L12-v2, for CPU-only consumers.
+
+Export the model once (requires torch, transformers and onnxruntime) :
+    python -m commons.onnx_embeddings export --output-dir models/minilml12v2-onnx-int8
+Check that it agrees with the PyTorch embeddings before enabling it with EMBEDDINGS_BACKEND=onnx :
+    python -m commons.onnx_embeddings check --model-dir models/minilml12v2-onnx-int8 [--sample data/data_xxx.jsonl]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from commons.embeddings import EMBEDDINGS_MODEL_NAME
+
+ONNX_MODEL_FILE = "model_quantized.onnx"
+ONNX_FP32_MODEL_FILE = "model.onnx"
+DEFAULT_ONNX_MODEL_DIR = "models/minilml12v2-onnx-int8"
+# max_seq_length of paraphrase-multilingual-MiniLM-L12-v2 in sentence-transformers
+MAX_SEQ_LENGTH = 128
+DEFAULT_BATCH_SIZE = 32
+# minimal cosine similarity between PyTorch and ONNX embeddings of the same text,
+# so that the 0.96 similarity threshold of the semantic strategies keeps its meaning
+DEFAULT_AGREEMENT_TOLERANCE = 0.99
+
+SAMPLE_TEXTS = [
+    "Introduction à la sociologie des organisations",
+    "Deep learning for multilingual information retrieval",
+    "Les politiques publiques de l'enseignement supérieur en France (1968-2008)",
+    "Article | Chapitre d'ouvrage\nHistoire économique de l'Europe médiévale",
+    "Über die Grundlagen der Quantenmechanik",
+    "La crisis de la democracia representativa en América Latina",
+]
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Mean-pooled sentence embeddings computed by onnxruntime, drop-in replacement for HuggingFaceEmbeddings
+    """
+
+    def __init__(self, model_dir: str, batch_size: int = None, intra_op_threads: int = None):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.batch_size = batch_size or int(os.getenv("ONNX_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+        options = onnxruntime.SessionOptions()
+        # 0 lets onnxruntime use all physical cores
+        options.intra_op_num_threads = intra_op_threads if intra_op_threads is not None \
+            else int(os.getenv("ONNX_INTRA_OP_THREADS", 0))
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, ONNX_MODEL_FILE), options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = [None] * len(texts)
+        # sort by length so that each batch is padded to similar lengths
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                     max_length=MAX_SEQ_LENGTH, return_tensors="np")
+            inputs = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+            mask = encoded["attention_mask"][..., np.newaxis].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            for index, vector in zip(batch, pooled):
+                vectors[index] = vector.tolist()
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+
+def export_quantized_model(output_dir: str, model_name: str = EMBEDDINGS_MODEL_NAME) -> None:
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_id = f"sentence-transformers/{model_name}"
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModel.from_pretrained(model_id).eval()
+    tokenizer.save_pretrained(output_dir)
+    dummy = tokenizer(["export"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, ONNX_FP32_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
+    quantize_dynamic(fp32_path, os.path.join(output_dir, ONNX_MODEL_FILE), weight_type=QuantType.QInt8)
+    print(f"Quantized model exported to {output_dir}")
+
+
+def cosine_agreement(reference_vectors: List[List[float]], candidate_vectors: List[List[float]]) -> np.ndarray:
+    reference = np.asarray(reference_vectors, dtype=np.float32)
+    candidate = np.asarray(candidate_vectors, dtype=np.float32)
+    return (reference * candidate).sum(axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+
+
+def load_sample_texts(path: str) -> List[str]:
+    """
+    Titles and title + abstract summaries of the references of a training data shard
+    """
+    texts = []
+    with open(path) as f:
+        for line in f:
+            line = json.loads(line)
+            for reference in (line["reference_1"], line["reference_2"]):
+                titles = " | ".join(title["value"] for title in reference["titles"])
+                abstracts = " | ".join(abstract["value"] for abstract in reference["abstracts"])
+                texts.append(titles)
+                if abstracts:
+                    texts.append(f"{titles}\n{abstracts}")
+    return texts
+
+
+def check_agreement(model_dir: str, texts: List[str], tolerance: float) -> bool:
+    from langchain.embeddings.huggingface import HuggingFaceEmbeddings
+
+    torch_embeddings = HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL_NAME)
+    onnx_embeddings = OnnxEmbeddings(model_dir)
+    start = time.perf_counter()
+    torch_vectors = torch_embeddings.embed_documents(texts)
+    torch_duration = time.perf_counter() - start
+    start = time.perf_counter()
+    onnx_vectors = onnx_embeddings.embed_documents(texts)
+    onnx_duration = time.perf_counter() - start
+    agreement = cosine_agreement(torch_vectors, onnx_vectors)
+    print(f"{len(texts)} texts, torch: {torch_duration:.2f}s, onnx: {onnx_duration:.2f}s")
+    print(f"cosine agreement min: {agreement.min():.4f}, mean: {agreement.mean():.4f}, tolerance: {tolerance}")
+    return bool(agreement.min() >= tolerance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Quantized ONNX encoder export and accuracy gate")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--output-dir", default=DEFAULT_ONNX_MODEL_DIR)
+    check_parser = subparsers.add_parser("check")
+    check_parser.add_argument("--model-dir", default=DEFAULT_ONNX_MODEL_DIR)
+    check_parser.add_argument("--sample", help="training data shard (data_*.jsonl) to take texts from")
+    check_parser.add_argument("--tolerance", type=float, default=DEFAULT_AGREEMENT_TOLERANCE)
+    args = parser.parse_args()
+    if args.command == "export":
+        export_quantized_model(args.output_dir)
+    else:
+        sample = load_sample_texts(args.sample) if args.sample else SAMPLE_TEXTS
+        if not check_agreement(args.model_dir, sample, args.tolerance):
+            print("ONNX embeddings do not agree with PyTorch embeddings")
+            sys.exit(1)
@@ -0,0 +1,66 @@
+"""
+cProfile sessions covering several threads : cProfile only profiles the thread where it is enabled, so the work
+submitted to the strategy executors is run under a profiler of its own thread while a session is active.
+"""
+import cProfile
+import pstats
+import threading
+from typing import Callable, List, Optional
+
+
+class ProfilingSession:
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def profiler(self) -> cProfile.Profile:
+        profiler = getattr(self._local, "profiler", None)
+        if profiler is None:
+            profiler = self._local.profiler = cProfile.Profile()
+            with self._lock:
+                self.profiles.append(profiler)
+        return profiler
+
+    def run(self, function: Callable):
+        profiler = self.profiler()
+        profiler.enable()
+        try:
+            return function()
+        finally:
+            profiler.disable()
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+
+_session: Optional[ProfilingSession] = None
+
+
+def start_session() -> ProfilingSession:
+    global _session
+    _session = ProfilingSession()
+    return _session
+
+
+def stop_session() -> Optional[ProfilingSession]:
+    global _session
+    session, _session = _session, None
+    return session
+
+
+def profiled(function: Callable) -> Callable:
+    """
+    The function, run under a profiler of the calling thread if a session is active when it is called
+    """
+    def run():
+        session = _session
+        return session.run(function) if session is not None else function()
+    return run
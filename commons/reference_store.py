@@ -0,0 +1,101 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from commons.models import Reference
+
+DEFAULT_REFERENCE_STORE_DB = "references.sqlite"
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+
+
+class ReferenceStore:
+    """
+    One canonical, zlib-compressed copy of each reference, keyed by its unique identifier,
+    in a local memory-mapped sqlite database.
+
+    Strategies hydrate their hits from the store before falling back on the indexes,
+    and report builders keep identifiers only.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("REFERENCE_STORE_DB", DEFAULT_REFERENCE_STORE_DB)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(f"PRAGMA mmap_size={int(os.getenv('REFERENCE_STORE_MMAP_SIZE', DEFAULT_MMAP_SIZE))}")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS refs ("
+                                 "identifier TEXT PRIMARY KEY, content_hash TEXT NOT NULL, data BLOB NOT NULL)")
+        self._connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _encode(reference: Reference) -> bytes:
+        return zlib.compress(json.dumps(reference.dict(), default=str).encode("utf-8"))
+
+    @staticmethod
+    def _decode(data: bytes) -> Reference:
+        return Reference(**json.loads(zlib.decompress(data)))
+
+    def put_many(self, references: Iterable[Reference]) -> None:
+        rows = [(reference.unique_identifier(), reference.content_hash(), self._encode(reference))
+                for reference in references]
+        if not rows:
+            return
+        with self._lock:
+            # unchanged references are not rewritten
+            self._connection.executemany(
+                "INSERT INTO refs VALUES (?, ?, ?) ON CONFLICT(identifier) DO UPDATE "
+                "SET content_hash = excluded.content_hash, data = excluded.data "
+                "WHERE refs.content_hash != excluded.content_hash", rows)
+            self._connection.commit()
+
+    def put(self, reference: Reference) -> None:
+        self.put_many([reference])
+
+    def get_many(self, identifiers: List[str],
+                 content_hashes: Dict[str, Optional[str]] = None) -> Dict[str, Reference]:
+        """
+        Stored references, those whose content hash differs from the expected one (if given) being misses :
+        another consumer may have indexed a newer version
+        """
+        if not identifiers:
+            return {}
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT identifier, content_hash, data FROM refs "
+                f"WHERE identifier IN ({','.join('?' * len(identifiers))})", identifiers).fetchall()
+        if content_hashes is not None:
+            rows = [row for row in rows if row[1] == content_hashes.get(row[0])]
+        self.hits += len(rows)
+        self.misses += len(identifiers) - len(rows)
+        return {identifier: self._decode(data) for identifier, _, data in rows}
+
+    def get(self, identifier: str) -> Optional[Reference]:
+        return self.get_many([identifier]).get(identifier)
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._connection.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+        return {"references": count, "hits": self.hits, "misses": self.misses}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_reference_store() -> Optional[ReferenceStore]:
+    """
+    Process-wide reference store, None unless REFERENCE_STORE=true
+    """
+    global _store
+    if os.getenv("REFERENCE_STORE", "false").lower() != "true":
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ReferenceStore()
+        return _store
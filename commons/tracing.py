@@ -0,0 +1,221 @@
+"""
+Lightweight tracing, exported in the OTLP/JSON format to a rotating local file : no collector is needed,
+and the files can be replayed into one later (e.g. with the otlpjsonfile receiver of the OpenTelemetry collector).
+
+A trace is started per AMQP message (or per background job) with start_trace, and nested spans are opened
+with span() from anywhere in the call stack, including executor threads running a copied context.
+A trace is exported if it was sampled (TRACE_SAMPLE_RATE) or if it took longer than TRACE_SLOW_THRESHOLD seconds.
+Tracing is disabled, and spans are no-ops, when both are 0.
+
+The durations of the es.* spans (Elasticsearch requests) are recorded in any case, for the prefetch controller.
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Iterator, List, Optional
+
+SERVICE_NAME = "svp-training-data"
+DEFAULT_TRACES_FILE = "traces/traces.jsonl"
+DEFAULT_TRACES_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_TRACES_BACKUP_COUNT = 5
+# spans of the Elasticsearch requests, and number of their durations kept until they are collected
+ES_SPAN_PREFIX = "es."
+ES_LATENCY_WINDOW = 10000
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    def __init__(self, name: str, trace: Optional["Trace"], parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.trace = trace
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.start = time.time_ns()
+        self.end = None
+        self.status = STATUS_OK
+        self.error = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.error = f"{type(exception).__name__}: {exception}"
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end or time.time_ns()),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status} | ({"message": self.error} if self.error else {}),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class NoopSpan:
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Trace:
+    def __init__(self, sampled: bool):
+        self.trace_id = random.getrandbits(128).to_bytes(16, "big").hex()
+        self.sampled = sampled
+        self.spans: List[Span] = []
+
+
+class RotatingFileSpanExporter:
+    """
+    Writes each trace as one OTLP/JSON ExportTraceServiceRequest line, rotating the file by size
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = None, backup_count: int = None):
+        path = path or os.getenv("TRACES_FILE", DEFAULT_TRACES_FILE)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=max_bytes or int(os.getenv("TRACES_MAX_BYTES", DEFAULT_TRACES_MAX_BYTES)),
+            backupCount=backup_count or int(os.getenv("TRACES_BACKUP_COUNT", DEFAULT_TRACES_BACKUP_COUNT)),
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger(f"{__name__}.exporter")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(handler)
+
+    def export(self, spans: List[Span]) -> None:
+        self.logger.info(json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": _otlp_value(SERVICE_NAME)},
+                                        {"key": "process.pid", "value": _otlp_value(os.getpid())}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}],
+        }]}, default=str))
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = None, slow_threshold: float = None):
+        self.sample_rate = sample_rate if sample_rate is not None \
+            else float(os.getenv("TRACE_SAMPLE_RATE", 0))
+        self.slow_threshold = slow_threshold if slow_threshold is not None \
+            else float(os.getenv("TRACE_SLOW_THRESHOLD", 0))
+        self.enabled = self.sample_rate > 0 or self.slow_threshold > 0
+        self.exported = 0
+        self._exporter = None
+        self._exporter_lock = threading.Lock()
+        self._current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+        self._es_latencies = deque(maxlen=ES_LATENCY_WINDOW)
+
+    @property
+    def exporter(self) -> RotatingFileSpanExporter:
+        with self._exporter_lock:
+            if self._exporter is None:
+                self._exporter = RotatingFileSpanExporter()
+            return self._exporter
+
+    @contextmanager
+    def _open(self, current: Span) -> Iterator[Span]:
+        token = self._current.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.record_exception(e)
+            raise
+        finally:
+            current.end = time.time_ns()
+            self._current.reset(token)
+
+    @contextmanager
+    def start_trace(self, name: str, **attributes) -> Iterator[Span | NoopSpan]:
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        trace = Trace(sampled=random.random() < self.sample_rate)
+        root = Span(name, trace, None, attributes)
+        trace.spans.append(root)
+        try:
+            with self._open(root):
+                yield root
+        finally:
+            duration = (root.end - root.start) / 1e9
+            if trace.sampled or 0 < self.slow_threshold < duration:
+                try:
+                    self.exporter.export(list(trace.spans))
+                    self.exported += 1
+                except Exception as e:
+                    print(f"Error exporting trace {trace.trace_id}: {e}")
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span | NoopSpan]:
+        if name.startswith(ES_SPAN_PREFIX):
+            start = time.perf_counter()
+            try:
+                with self._span(name, **attributes) as current:
+                    yield current
+            finally:
+                self._es_latencies.append(time.perf_counter() - start)
+        else:
+            with self._span(name, **attributes) as current:
+                yield current
+
+    @contextmanager
+    def _span(self, name: str, **attributes) -> Iterator[Span | NoopSpan]:
+        parent = self._current.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        child = Span(name, parent.trace, parent, attributes)
+        parent.trace.spans.append(child)
+        with self._open(child):
+            yield child
+
+    def collect_es_latencies(self) -> List[float]:
+        """
+        Durations of the Elasticsearch requests ended since the previous collection
+        """
+        latencies = []
+        while self._es_latencies:
+            latencies.append(self._es_latencies.popleft())
+        return latencies
+
+
+tracer = Tracer()
+
+
+def start_trace(name: str, **attributes):
+    return tracer.start_trace(name, **attributes)
+
+
+def span(name: str, **attributes):
+    return tracer.span(name, **attributes)
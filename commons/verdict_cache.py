@@ -0,0 +1,198 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from commons.models import Reference, Result
+
+DEFAULT_VERDICT_CACHE_SIZE = 100000
+DEFAULT_VERDICT_CACHE_TTL = 3600
+
+# unique identifier and content hash of both references
+PairKey = Tuple[str, str, str, str]
+
+
+class PairVerdict:
+    """
+    Outcome of the comparison of a reference with a candidate : strategies that found the candidate,
+    their scores, and the duplicate verdict
+    """
+
+    def __init__(self, reference2: Reference, similarity_strategies: List[str], scores: List[float],
+                 is_duplicate: bool):
+        self.reference2 = reference2
+        self.similarity_strategies = list(similarity_strategies)
+        self.scores = list(scores)
+        self.is_duplicate = bool(is_duplicate)
+
+    def to_result(self, reference1: Reference) -> Result:
+        # copies : candidate sets extend the strategies and scores of the results they merge
+        return Result(reference1=reference1, reference2=self.reference2,
+                      similarity_strategies=list(self.similarity_strategies), scores=list(self.scores))
+
+
+class VerdictCache:
+    """
+    Pair verdicts shared by all authors, keyed by the unique identifiers and content hashes of both references,
+    in a bounded LRU, optionally persisted to a local sqlite database (VERDICT_CACHE_DB).
+
+    The candidates found for a version of a reference are recorded as well : when the same version comes again
+    within VERDICT_CACHE_TTL seconds, e.g. in the message of another co-author, the strategies and the duplicate
+    detector are not run again. Versions of references processed with degraded strategies are not recorded.
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None, path: str = None):
+        self.max_size = max_size or int(os.getenv("VERDICT_CACHE_SIZE", DEFAULT_VERDICT_CACHE_SIZE))
+        self.ttl = ttl if ttl is not None else float(os.getenv("VERDICT_CACHE_TTL", DEFAULT_VERDICT_CACHE_TTL))
+        self.path = path or os.getenv("VERDICT_CACHE_DB")
+        self._lock = threading.Lock()
+        self._pairs: OrderedDict[PairKey, PairVerdict] = OrderedDict()
+        # (unique identifier, content hash) -> (recording time, candidates as (unique identifier, content hash))
+        self._runs: OrderedDict[Tuple[str, str], Tuple[float, List[Tuple[str, str]]]] = OrderedDict()
+        self._connection = self._connect() if self.path else None
+        self.hits = 0
+        self.misses = 0
+        self.pair_hits = 0
+        self.pair_misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS pairs ("
+                           "identifier1 TEXT NOT NULL, hash1 TEXT NOT NULL, identifier2 TEXT NOT NULL, "
+                           "hash2 TEXT NOT NULL, data BLOB NOT NULL, "
+                           "PRIMARY KEY (identifier1, hash1, identifier2, hash2))")
+        connection.execute("CREATE TABLE IF NOT EXISTS runs ("
+                           "identifier TEXT NOT NULL, content_hash TEXT NOT NULL, created REAL NOT NULL, "
+                           "candidates TEXT NOT NULL, PRIMARY KEY (identifier, content_hash))")
+        connection.commit()
+        return connection
+
+    @staticmethod
+    def _encode(verdict: PairVerdict) -> bytes:
+        return zlib.compress(json.dumps({"reference2": verdict.reference2.dict(),
+                                         "similarity_strategies": verdict.similarity_strategies,
+                                         "scores": verdict.scores,
+                                         "is_duplicate": verdict.is_duplicate}, default=str).encode("utf-8"))
+
+    @staticmethod
+    def _decode(data: bytes) -> PairVerdict:
+        fields = json.loads(zlib.decompress(data))
+        return PairVerdict(Reference(**fields["reference2"]), fields["similarity_strategies"], fields["scores"],
+                           fields["is_duplicate"])
+
+    def _remember(self, cache: OrderedDict, key, value) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_size:
+            cache.popitem(last=False)
+
+    def _get_pair(self, key: PairKey) -> Optional[PairVerdict]:
+        # called with the lock held
+        verdict = self._pairs.get(key)
+        if verdict is not None:
+            self._pairs.move_to_end(key)
+            return verdict
+        if self._connection is None:
+            return None
+        row = self._connection.execute("SELECT data FROM pairs WHERE identifier1 = ? AND hash1 = ? "
+                                       "AND identifier2 = ? AND hash2 = ?", key).fetchone()
+        if row is None:
+            return None
+        verdict = self._decode(row[0])
+        self._remember(self._pairs, key, verdict)
+        return verdict
+
+    def get_many(self, reference: Reference, candidates: List[Reference]) -> List[Optional[PairVerdict]]:
+        """
+        Cached verdicts of the reference against each candidate, None where the pair is unknown
+        """
+        identifier, content_hash = reference.unique_identifier(), reference.content_hash()
+        with self._lock:
+            verdicts = [self._get_pair((identifier, content_hash, candidate.unique_identifier(),
+                                        candidate.content_hash())) for candidate in candidates]
+        found = sum(verdict is not None for verdict in verdicts)
+        self.pair_hits += found
+        self.pair_misses += len(verdicts) - found
+        return verdicts
+
+    def put_many(self, reference: Reference, verdicts: List[PairVerdict], complete: bool = True) -> None:
+        """
+        Record the verdicts of the reference against its candidates,
+        and the candidates themselves if all the strategies contributed to them
+        """
+        identifier, content_hash = reference.unique_identifier(), reference.content_hash()
+        keys = [(identifier, content_hash, verdict.reference2.unique_identifier(), verdict.reference2.content_hash())
+                for verdict in verdicts]
+        now = time.time()
+        with self._lock:
+            for key, verdict in zip(keys, verdicts):
+                self._remember(self._pairs, key, verdict)
+            if complete:
+                self._remember(self._runs, (identifier, content_hash), (now, [key[2:] for key in keys]))
+            if self._connection is None:
+                return
+            self._connection.executemany("INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?, ?)",
+                                         [key + (self._encode(verdict),) for key, verdict in zip(keys, verdicts)])
+            if complete:
+                self._connection.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)",
+                                         (identifier, content_hash, now, json.dumps([key[2:] for key in keys])))
+            self._connection.commit()
+
+    def candidates(self, reference: Reference) -> Optional[List[PairVerdict]]:
+        """
+        Verdicts of all the candidates recorded for this version of the reference less than ttl seconds ago,
+        None if there is no such record or if one of the verdicts is no longer cached
+        """
+        identifier, content_hash = reference.unique_identifier(), reference.content_hash()
+        with self._lock:
+            run = self._run((identifier, content_hash))
+            verdicts = None
+            if run is not None and time.time() - run[0] < self.ttl:
+                verdicts = [self._get_pair((identifier, content_hash) + tuple(candidate)) for candidate in run[1]]
+                if any(verdict is None for verdict in verdicts):
+                    verdicts = None
+        if verdicts is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return verdicts
+
+    def _run(self, key: Tuple[str, str]) -> Optional[Tuple[float, List[Tuple[str, str]]]]:
+        # called with the lock held
+        run = self._runs.get(key)
+        if run is not None or self._connection is None:
+            return run
+        row = self._connection.execute("SELECT created, candidates FROM runs WHERE identifier = ? "
+                                       "AND content_hash = ?", key).fetchone()
+        if row is None:
+            return None
+        run = (row[0], [tuple(candidate) for candidate in json.loads(row[1])])
+        self._remember(self._runs, key, run)
+        return run
+
+    def stats(self) -> Dict[str, int]:
+        return {"pairs": len(self._pairs), "references": len(self._runs), "hits": self.hits, "misses": self.misses,
+                "pair_hits": self.pair_hits, "pair_misses": self.pair_misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_verdict_cache() -> Optional[VerdictCache]:
+    """
+    Process-wide verdict cache, None unless VERDICT_CACHE=true
+    """
+    global _cache
+    if os.getenv("VERDICT_CACHE", "false").lower() != "true":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = VerdictCache()
+        return _cache
@@ -0,0 +1,144 @@
+"""
+Profiling endpoints of the health server, registered only when DEBUG_ENDPOINTS=true :
+
+- /debug/profile?seconds=30&format=collapsed : CPU profile for N seconds, as collapsed stacks of all threads
+  sampled every few milliseconds, each stack starting with the thread name (flame graph input),
+  or with format=pstats as a cProfile dump (python -m pstats, snakeviz...) of the event loop thread, where messages
+  are consumed, and of the strategy executor threads, where the strategies query ES
+- /debug/memory/start?frames=10, /debug/memory/stop : start and stop tracemalloc (which slows the process down)
+- /debug/memory/top?limit=30&group_by=lineno&compare=true : top allocators of a tracemalloc snapshot,
+  or their growth since the previous snapshot
+- /debug/objects?limit=30 : live object counts, by type, and sizes of the application caches
+"""
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict
+
+from aiohttp import web
+
+from commons import profiling
+
+DEFAULT_PROFILE_SECONDS = 30
+MAX_PROFILE_SECONDS = 300
+SAMPLING_INTERVAL = 0.005
+
+
+def debug_endpoints_enabled() -> bool:
+    return os.getenv("DEBUG_ENDPOINTS", "false").lower() == "true"
+
+
+def sample_stacks(seconds: float, interval: float = SAMPLING_INTERVAL) -> Counter:
+    """
+    Sample the stacks of all threads but the sampling one, counting the collapsed stacks
+    ("thread name;outer;...;inner" frames)
+    """
+    stacks = Counter()
+    sampler = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if frames:
+                stacks[";".join([names.get(thread_id, str(thread_id))] + frames[::-1])] += 1
+        time.sleep(interval)
+    return stacks
+
+
+class DebugEndpoints:
+    def __init__(self, application_counts: Callable[[], Dict[str, int]] = None):
+        # sizes of the application structures (report builders, caches...), provided by the consumer
+        self.application_counts = application_counts or (lambda: {})
+        self._profiling = asyncio.Lock()
+        self._previous_snapshot = None
+
+    def add_routes(self, app: web.Application) -> None:
+        app.router.add_get('/debug/profile', self.profile)
+        app.router.add_get('/debug/memory/start', self.memory_start)
+        app.router.add_get('/debug/memory/stop', self.memory_stop)
+        app.router.add_get('/debug/memory/top', self.memory_top)
+        app.router.add_get('/debug/objects', self.objects)
+
+    async def profile(self, request: web.Request) -> web.StreamResponse:
+        seconds = min(float(request.query.get("seconds", DEFAULT_PROFILE_SECONDS)), MAX_PROFILE_SECONDS)
+        output_format = request.query.get("format", "collapsed")
+        if output_format not in ("collapsed", "pstats"):
+            return web.Response(status=400, text="format must be collapsed or pstats")
+        if self._profiling.locked():
+            return web.Response(status=409, text="A profile is already running")
+        async with self._profiling:
+            if output_format == "pstats":
+                return await self._cprofile(seconds)
+            stacks = await asyncio.get_running_loop().run_in_executor(None, sample_stacks, seconds)
+        return web.Response(text="".join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+
+    @staticmethod
+    async def _cprofile(seconds: float) -> web.Response:
+        # the event loop thread is profiled here, the strategy executor threads by the calls they run
+        session = profiling.start_session()
+        profiler = session.profiler()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+            profiling.stop_session()
+        with tempfile.NamedTemporaryFile(suffix=".pstats") as f:
+            session.stats().dump_stats(f.name)
+            body = f.read()
+        return web.Response(body=body, content_type="application/octet-stream",
+                            headers={"Content-Disposition": "attachment; filename=profile.pstats"})
+
+    async def memory_start(self, request: web.Request) -> web.Response:
+        if tracemalloc.is_tracing():
+            return web.Response(text="tracemalloc already started")
+        tracemalloc.start(int(request.query.get("frames", 10)))
+        return web.Response(text="tracemalloc started")
+
+    async def memory_stop(self, request: web.Request) -> web.Response:
+        tracemalloc.stop()
+        self._previous_snapshot = None
+        return web.Response(text="tracemalloc stopped")
+
+    async def memory_top(self, request: web.Request) -> web.Response:
+        if not tracemalloc.is_tracing():
+            return web.Response(status=409, text="tracemalloc is not started, see /debug/memory/start")
+        limit = int(request.query.get("limit", 30))
+        group_by = request.query.get("group_by", "lineno")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        if request.query.get("compare", "false").lower() == "true" and self._previous_snapshot is not None:
+            statistics = snapshot.compare_to(self._previous_snapshot, group_by)
+        else:
+            statistics = snapshot.statistics(group_by)
+        self._previous_snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced memory : {current / 2 ** 20:.1f} MiB, peak {peak / 2 ** 20:.1f} MiB"]
+        for statistic in statistics[:limit]:
+            lines.append(str(statistic))
+            if group_by == "traceback":
+                lines.extend(f"    {line}" for line in statistic.traceback.format())
+        return web.Response(text="\n".join(lines) + "\n")
+
+    async def objects(self, request: web.Request) -> web.Response:
+        limit = int(request.query.get("limit", 30))
+        counts = Counter(type(obj).__qualname__ for obj in gc.get_objects())
+        return web.json_response({
+            "application": self.application_counts(),
+            "Reference": counts.get("Reference", 0),
+            "top_types": dict(counts.most_common(limit)),
+        })
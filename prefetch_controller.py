@@ -0,0 +1,103 @@
+import os
+import time
+from collections import Counter, deque
+from statistics import median
+
+from commons.tracing import tracer
+
+DEFAULT_MIN_PREFETCH = 1
+DEFAULT_MAX_PREFETCH = 100
+DEFAULT_ADJUST_INTERVAL = 10.0
+DEFAULT_ES_LATENCY_BUDGET = 0.5
+DEFAULT_MAX_PREFETCH_WAIT = 10.0
+# measures kept between two adjustments
+WINDOW_SIZE = 1000
+
+
+class PrefetchController:
+    """
+    Adjusts the prefetch count (QoS) of the consumer channel at runtime, within [AMQP_PREFETCH_MIN, AMQP_PREFETCH_MAX].
+
+    Every AMQP_PREFETCH_ADJUST_INTERVAL seconds, from the processing times of the messages handled since the last
+    adjustment and the durations of the Elasticsearch requests made meanwhile (es.* spans) :
+    - if the median ES request exceeds PREFETCH_ES_LATENCY_BUDGET, the prefetch count is halved, so that messages
+      stay in the broker instead of waiting in memory for an overloaded cluster,
+    - a prefetched message waits about prefetch count x processing time before being handled : the prefetch count
+      is capped so that this wait stays under PREFETCH_MAX_WAIT seconds,
+    - otherwise, it is increased by one, to hide the broker round trips.
+    """
+
+    def __init__(self, channel, initial: int = None, minimum: int = None, maximum: int = None,
+                 adjust_interval: float = None, es_latency_budget: float = None, max_wait: float = None):
+        self.channel = channel
+        self.minimum = minimum or int(os.getenv("AMQP_PREFETCH_MIN", DEFAULT_MIN_PREFETCH))
+        self.maximum = maximum or int(os.getenv("AMQP_PREFETCH_MAX", DEFAULT_MAX_PREFETCH))
+        initial = initial or int(os.getenv("AMQP_PREFETCH_COUNT", 10))
+        self.prefetch_count = min(max(initial, self.minimum), self.maximum)
+        self.adjust_interval = adjust_interval if adjust_interval is not None \
+            else float(os.getenv("AMQP_PREFETCH_ADJUST_INTERVAL", DEFAULT_ADJUST_INTERVAL))
+        self.es_latency_budget = es_latency_budget or float(os.getenv("PREFETCH_ES_LATENCY_BUDGET",
+                                                                      DEFAULT_ES_LATENCY_BUDGET))
+        self.max_wait = max_wait or float(os.getenv("PREFETCH_MAX_WAIT", DEFAULT_MAX_PREFETCH_WAIT))
+        self.processing_times = deque(maxlen=WINDOW_SIZE)
+        self.es_latencies = deque(maxlen=WINDOW_SIZE)
+        self.decisions = Counter()
+        self.last_decision = None
+        self._last_adjustment = time.monotonic()
+        # requests made before the first adjustment window are not counted
+        tracer.collect_es_latencies()
+
+    async def start(self) -> None:
+        await self.channel.set_qos(prefetch_count=self.prefetch_count)
+
+    async def record(self, processing_time: float) -> None:
+        self.processing_times.append(processing_time)
+        if time.monotonic() - self._last_adjustment >= self.adjust_interval:
+            await self.adjust()
+
+    def _limit(self) -> int:
+        if not self.processing_times:
+            return self.maximum
+        processing_time = median(self.processing_times)
+        if processing_time <= 0:
+            return self.maximum
+        return min(self.maximum, max(self.minimum, int(self.max_wait / processing_time)))
+
+    def _decide(self) -> tuple[int, str]:
+        if self.es_latencies and median(self.es_latencies) > self.es_latency_budget:
+            return max(self.minimum, self.prefetch_count // 2), "es_latency"
+        limit = self._limit()
+        if self.prefetch_count > limit:
+            return limit, "processing_time"
+        return min(limit, self.prefetch_count + 1), "healthy"
+
+    async def adjust(self) -> None:
+        self._last_adjustment = time.monotonic()
+        self.es_latencies.extend(tracer.collect_es_latencies())
+        prefetch_count, reason = self._decide()
+        self.decisions[reason] += 1
+        self.last_decision = {"reason": reason, "from": self.prefetch_count, "to": prefetch_count,
+                              "at": time.time(), "messages": len(self.processing_times),
+                              "median_processing_time": median(self.processing_times) if self.processing_times
+                              else None,
+                              "es_requests": len(self.es_latencies),
+                              "median_es_latency": median(self.es_latencies) if self.es_latencies else None}
+        self.processing_times.clear()
+        self.es_latencies.clear()
+        if prefetch_count == self.prefetch_count:
+            return
+        try:
+            await self.channel.set_qos(prefetch_count=prefetch_count)
+        except Exception as e:
+            print(f"Error setting prefetch count to {prefetch_count}: {e}")
+            return
+        print(f"Prefetch count {self.prefetch_count} -> {prefetch_count} ({reason})")
+        self.prefetch_count = prefetch_count
+
+    def stats(self) -> dict:
+        return {
+            "prefetch_count": self.prefetch_count,
+            "bounds": [self.minimum, self.maximum],
+            "decisions": dict(self.decisions),
+            "last_decision": self.last_decision,
+        }
@@ -0,0 +1,81 @@
+"""
+Offline replay of a cassette recorded by a consumer with CASSETTE_MODE=record (see commons.cassette) :
+the recorded messages go through the same processing as in the consumer, Elasticsearch being served from the
+cassette, without RabbitMQ nor any network access. Reports and data files are written to the output directory.
+The strategy settings (enabled strategies, retrieval modes...) must be the ones of the recording.
+
+--latency : ES response times, "original", "none" or a factor applied to the recorded ones
+--pace : message arrivals, "none" (as fast as possible) or "original" (recorded intervals between messages)
+
+Usage : python -m replay cassettes/cassette.jsonl.gz [--latency none] [--pace none] [--output-dir replay]
+                                                     [--limit 1000]
+"""
+import argparse
+import os
+import time
+from statistics import median, quantiles
+
+
+class ReplayedMessage:
+    """
+    Recorded AMQP delivery, with the attributes of an aio_pika message read by the consumer
+    """
+
+    def __init__(self, routing_key: str, body: bytes):
+        self.routing_key = routing_key
+        self.body = body if isinstance(body, bytes) else body.encode("utf-8")
+
+
+def replay(limit: int = None, pace: str = "none") -> None:
+    # imported once the cassette settings are in the environment
+    import main
+    from commons.cassette import get_player
+    from commons.tracing import start_trace
+    from reports.report_writer import ReportWriter
+
+    player = get_player()
+    start = time.perf_counter()
+    main.strategy_registry.initialize()
+    print(f"Strategies built in {time.perf_counter() - start:.2f}s : "
+          f"{[strategy.get_name() for strategy in main.strategy_registry.strategies]}")
+    main.report_writer = ReportWriter(os.environ["REPORTS_DIR"])
+    main.open_new_file()
+    messages = player.messages[:limit] if limit else player.messages
+    durations = []
+    start = time.perf_counter()
+    previous = messages[0][0] if messages else 0.0
+    for recorded_at, routing_key, body in messages:
+        if pace == "original":
+            time.sleep(max(0.0, recorded_at - previous))
+        previous = recorded_at
+        message_start = time.perf_counter()
+        with start_trace("message", lane="replay", routing_key=routing_key, body_size=len(body)):
+            main.handle_message(ReplayedMessage(routing_key, body))
+        durations.append(time.perf_counter() - message_start)
+    elapsed = time.perf_counter() - start
+    main.report_writer.flush()
+    main.current_file.close()
+    if len(durations) > 1:
+        print(f"{len(durations)} messages in {elapsed:.2f}s, {len(durations) / elapsed:.1f} messages/s, "
+              f"median {median(durations) * 1000:.1f} ms, p95 {quantiles(durations, n=20)[-1] * 1000:.1f} ms")
+    print(f"Cassette : {player.stats()}")
+    print(f"Strategies : {main.strategy_cascade.stats()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline replay of a recorded cassette")
+    parser.add_argument("cassette", help="gzipped JSONL cassette")
+    parser.add_argument("--latency", default="none", help='"original", "none" or a factor of the recorded latencies')
+    parser.add_argument("--pace", choices=["none", "original"], default="none")
+    parser.add_argument("--output-dir", default="replay", help="reports and data files of the replay")
+    parser.add_argument("--limit", type=int, default=None, help="number of messages to replay")
+    args = parser.parse_args()
+    os.environ |= {"CASSETTE_MODE": "replay", "CASSETTE_FILE": args.cassette, "CASSETTE_LATENCY": args.latency,
+                   "REPORTS_DIR": os.path.join(args.output_dir, "authors"),
+                   "DATA_DIR": os.path.join(args.output_dir, "data")}
+    # without the local state of the recording consumer, unchanged references are written again rather than
+    # looked up in ES, the writes being acknowledged by the replay transport
+    os.environ.setdefault("SKIP_UNCHANGED_REFERENCES", "false")
+    os.environ.setdefault("CONTENT_HASH_DB", os.path.join(args.output_dir, "content_hashes.sqlite"))
+    os.makedirs(os.environ["DATA_DIR"], exist_ok=True)
+    replay(args.limit, args.pace)
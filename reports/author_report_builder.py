@@ -1,18 +1,22 @@
 from collections import defaultdict
 from itertools import chain
-from typing import List
+from typing import Dict, List, Optional
 
 from commons.models import Entity, Reference
+from commons.reference_store import ReferenceStore
 
 
 class AuthorReportBuilder:
-    def __init__(self, entity: Entity):
+    def __init__(self, entity: Entity, reference_store: ReferenceStore = None):
         self.visual_ids = None
         self.entity = entity
-        self.references = {}
-        self.potential_references = {}
-        self.trivial_duplicates = []
-        self.potential_duplicates = []
+        # with a reference store, references are kept as identifiers (None values) and loaded when rendering
+        self.reference_store = reference_store
+        self.references: Dict[str, Optional[Reference]] = {}
+        self.potential_references: Dict[str, Optional[Reference]] = {}
+        # dicts used as insertion-ordered sets of (unique identifier, unique identifier) pairs
+        self.trivial_duplicates = {}
+        self.potential_duplicates = {}
         self.report_lines = None
         self.potential_duplicates_chains = defaultdict(list)
 
@@ -20,30 +24,76 @@ class AuthorReportBuilder:
         if reference.unique_identifier() in self.potential_references:
             self.potential_references.pop(reference.unique_identifier())
         if reference.unique_identifier() not in self.references:
-            self.references[reference.unique_identifier()] = reference
+            self.references[reference.unique_identifier()] = self._keep(reference)
 
     def add_potential_reference(self, reference: Reference):
         if reference.unique_identifier() not in self.references \
                 and reference.unique_identifier() not in self.potential_references:
-            self.potential_references[reference.unique_identifier()] = reference
+            self.potential_references[reference.unique_identifier()] = self._keep(reference)
+
+    def _keep(self, reference: Reference) -> Optional[Reference]:
+        if self.reference_store is None:
+            return reference
+        self.reference_store.put(reference)
+        return None
+
+    def _resolve(self, references: Dict[str, Optional[Reference]]) -> Dict[str, Reference]:
+        if self.reference_store is None:
+            return references
+        stored = self.reference_store.get_many(list(references))
+        return {identifier: stored.get(identifier) for identifier in references}
 
     def add_trivial_duplicate(self, reference1: Reference, reference2: Reference):
-        self.trivial_duplicates.append((reference1.unique_identifier(), reference2.unique_identifier()))
-        # Remote duplicated tuples from trivial_duplicates
-        self.trivial_duplicates = list(set(self.trivial_duplicates))
+        self.trivial_duplicates[(reference1.unique_identifier(), reference2.unique_identifier())] = None
 
     def get_trivial_duplicates(self):
-        return self.trivial_duplicates
+        return self.trivial_duplicates.keys()
 
     def add_potential_duplicate(self, reference1: Reference, reference2: Reference):
-        self.potential_duplicates.append((reference1.unique_identifier(), reference2.unique_identifier()))
-        # Remote duplicated tuples from potential_duplicates
-        self.potential_duplicates = list(set(self.potential_duplicates))
+        self.potential_duplicates[(reference1.unique_identifier(), reference2.unique_identifier())] = None
+
+    def to_state(self) -> dict:
+        """
+        Content of the report as plain data, references included, to be merged with the report of the same author
+        built by another consumer lane
+        """
+        return {
+            "entity": self.entity.dict(),
+            "references": [reference.dict() for reference in filter(None, self._resolve(self.references).values())],
+            "potential_references": [reference.dict() for reference in
+                                     filter(None, self._resolve(self.potential_references).values())],
+            "trivial_duplicates": list(self.trivial_duplicates),
+            "potential_duplicates": list(self.potential_duplicates),
+        }
+
+    def merge_state(self, state: dict) -> None:
+        """
+        Add the content of a report built by another lane : references attached in one of them are attached
+        """
+        for reference in state["references"]:
+            self.add_reference(Reference(**reference))
+        for reference in state["potential_references"]:
+            self.add_potential_reference(Reference(**reference))
+        for pair in state["trivial_duplicates"]:
+            self.trivial_duplicates[tuple(pair)] = None
+        for pair in state["potential_duplicates"]:
+            self.potential_duplicates[tuple(pair)] = None
 
-    def dump_report(self, directory: str):
+    @classmethod
+    def from_states(cls, states: List[dict]) -> "AuthorReportBuilder":
+        builder = cls(entity=Entity(**states[0]["entity"]))
+        for state in states:
+            builder.merge_state(state)
+        return builder
+
+    def render_report(self) -> str:
         self.generate_report()
+        return "\n".join(self.report_lines)
+
+    def dump_report(self, directory: str):
+        report = self.render_report()
         with open(f"{directory}/{self.get_main_entity_id(self.entity)}.txt", "w") as f:
-            f.write("\n".join(self.report_lines))
+            f.write(report)
 
     def _group_trivial_duplicates(self):
         parent = {}
@@ -82,18 +132,19 @@ class AuthorReportBuilder:
         self.report_lines = []
         self.visual_ids = {}
         self._print_entity()
-        single_references, trivial_groups = self._compute_groups()
+        references = self._resolve(self.references)
+        single_references, trivial_groups = self._compute_groups(references)
         self._print_single_references(single_references)
-        self._print_potential_references()
-        self._print_trivial_duplicates(trivial_groups)
+        self._print_potential_references(self._resolve(self.potential_references))
+        self._print_trivial_duplicates(trivial_groups, references)
         self._print_potential_duplicates()
         potential_duplicate_chains = self._build_potential_duplicate_chains()
         self._print_potential_duplicate_chains(potential_duplicate_chains)
 
-    def _compute_groups(self):
+    def _compute_groups(self, references: Dict[str, Reference]):
         trivial_groups = self._group_trivial_duplicates()
         trivial_ids = set(chain.from_iterable(trivial_groups))
-        single_references = [ref for ref_id, ref in self.references.items() if ref_id not in trivial_ids]
+        single_references = [ref for ref_id, ref in references.items() if ref_id not in trivial_ids and ref]
         return single_references, trivial_groups
 
     def _build_potential_duplicate_graph(self):
@@ -165,7 +216,7 @@ class AuthorReportBuilder:
 
         self.report_lines.append("=" * border_length)
 
-    def _print_trivial_duplicates(self, trivial_groups):
+    def _print_trivial_duplicates(self, trivial_groups, references: Dict[str, Reference]):
         self.print_subtitle("Trivial Duplicate Groups")
         self.report_lines.append(
             "These references can be treated as identical by their identifiers or manifestations.")
@@ -174,7 +225,7 @@ class AuthorReportBuilder:
             self._print_group_header(group_number)
             reference_number = 1
             for ref_id in group:
-                reference = self.references[ref_id]
+                reference = references[ref_id]
                 if reference:
                     visual_id = f"G{group_number}-R{reference_number}"
                     self._print_reference(reference, visual_id)
@@ -193,12 +244,12 @@ class AuthorReportBuilder:
             reference_number += 1
             self.visual_ids[reference.unique_identifier()] = visual_id
 
-    def _print_potential_references(self):
+    def _print_potential_references(self, potential_references: Dict[str, Reference]):
         self.print_subtitle("Potential References:")
         self.report_lines.append(
             "These references are likely to be attached to this author only if potential duplicates are confirmed.")
         reference_number = 1
-        for reference in self.potential_references.values():
+        for reference in filter(None, potential_references.values()):
             visual_id = f"PR{reference_number}"
             self._print_reference(reference, visual_id)
             reference_number += 1
@@ -0,0 +1,125 @@
+"""
+Rebuild the author reports from the training data corpus, without replaying the messages through RabbitMQ.
+
+The data_*.jsonl shards are streamed once and their lines are partitioned on disk by main entity id,
+then each partition is rebuilt by a worker process : only the report builders of one partition are in memory
+at a time, whatever the size of the corpus.
+
+Reports are rebuilt from the written candidates only : references without any candidate, and candidates
+discarded before being written (trivial duplicates, harvester-specific filters) do not appear in the corpus.
+The rebuilt reports are therefore incomplete : they are written to an empty directory, never over the reports
+of the consumer (REPORTS_DIR).
+
+Usage : python -m reports.rebuild --reports-dir rebuilt_authors [--data-dir data] [--workers 8] [--partitions 64]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import fsspec
+
+from commons.models import Entity, Reference
+from reports.author_report_builder import AuthorReportBuilder
+from reports.report_writer import ReportWriter
+from simple_duplicate_detector import SimpleDuplicateDetector
+
+
+def partition_shards(data_dir: str, partitions_dir: str, partitions: int) -> List[str]:
+    """
+    Stream all the shards and append each line to the partition file of its main entity id
+    """
+    paths = [os.path.join(partitions_dir, f"partition_{index:04d}.jsonl") for index in range(partitions)]
+    files = [open(path, "w") for path in paths]
+    lines = 0
+    try:
+        for shard in fsspec.open_files(f"{data_dir}/data_*.jsonl", "r"):
+            with shard as f:
+                for line in f:
+                    entity = Entity(**json.loads(line)["entity"])
+                    main_entity_id = AuthorReportBuilder.get_main_entity_id(entity)
+                    files[zlib.crc32(main_entity_id.encode("utf-8")) % partitions].write(line)
+                    lines += 1
+            print(f"{shard.path} partitioned, {lines} lines so far")
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def replay_candidate(report_builder: AuthorReportBuilder, reference1: Reference, reference2: Reference) -> None:
+    report_builder.add_reference(reference1)
+    if SimpleDuplicateDetector(reference1, reference2).is_duplicate():
+        report_builder.add_reference(reference2)
+        report_builder.add_trivial_duplicate(reference1, reference2)
+    else:
+        report_builder.add_potential_reference(reference2)
+    if (reference1.unique_identifier(), reference2.unique_identifier()) \
+            not in report_builder.get_trivial_duplicates():
+        report_builder.add_potential_duplicate(reference1, reference2)
+
+
+def rebuild_partition(partition_path: str, reports_dir: str) -> int:
+    report_builders: Dict[str, AuthorReportBuilder] = {}
+    with open(partition_path) as f:
+        for line in f:
+            line = json.loads(line)
+            entity = Entity(**line["entity"])
+            main_entity_id = AuthorReportBuilder.get_main_entity_id(entity)
+            if main_entity_id not in report_builders:
+                report_builders[main_entity_id] = AuthorReportBuilder(entity=entity)
+            replay_candidate(report_builders[main_entity_id],
+                             Reference(**line["reference_1"]), Reference(**line["reference_2"]))
+    report_writer = ReportWriter(reports_dir)
+    for main_entity_id, report_builder in report_builders.items():
+        report_writer.mark_dirty(main_entity_id, report_builder)
+    report_writer.flush()
+    return len(report_builders)
+
+
+def check_reports_dir(reports_dir: str) -> None:
+    """
+    Refuse to write over the reports of the consumer, or over any existing report
+    """
+    fs, path = fsspec.core.url_to_fs(reports_dir)
+    live_fs, live_path = fsspec.core.url_to_fs(os.getenv("REPORTS_DIR", "authors"))
+    if type(fs) is type(live_fs) and path.rstrip("/") == live_path.rstrip("/"):
+        raise ValueError(f"{reports_dir} holds the reports of the consumer : rebuilt reports need another directory")
+    if fs.exists(path) and fs.ls(path):
+        raise ValueError(f"{reports_dir} is not empty : rebuilt reports need an empty directory")
+
+
+def rebuild_reports(data_dir: str, reports_dir: str, workers: int, partitions: int) -> None:
+    start = time.perf_counter()
+    partitions_dir = tempfile.mkdtemp(prefix="report_partitions_")
+    try:
+        paths = partition_shards(data_dir, partitions_dir, partitions)
+        authors = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for index, count in enumerate(executor.map(rebuild_partition, paths, [reports_dir] * len(paths))):
+                authors += count
+                print(f"{index + 1}/{len(paths)} partitions rebuilt, {authors} authors, "
+                      f"{time.perf_counter() - start:.0f}s")
+    finally:
+        shutil.rmtree(partitions_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild author reports from the training data shards")
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data"))
+    parser.add_argument("--reports-dir", required=True,
+                        help="empty directory, other than the consumer REPORTS_DIR, for the rebuilt reports")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--partitions", type=int, default=64,
+                        help="number of partitions, to increase when the corpus does not fit in memory / workers")
+    args = parser.parse_args()
+    try:
+        check_reports_dir(args.reports_dir)
+    except ValueError as e:
+        parser.error(str(e))
+    rebuild_reports(args.data_dir, args.reports_dir, args.workers, args.partitions)
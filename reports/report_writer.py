@@ -0,0 +1,159 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+from typing import Dict, List, Tuple
+
+import fsspec
+
+from commons.tracing import span, start_trace
+from reports.author_report_builder import AuthorReportBuilder
+
+DEFAULT_FLUSH_INTERVAL = 10.0
+# content of the reports of each consumer lane, under the reports directory
+LANES_DIR = "lanes"
+
+
+class ReportWriter:
+    """
+    Writes the reports of the authors marked as dirty, periodically, to any fsspec URL (local directory or bucket).
+
+    Reports are rendered on the event loop, where builders are updated, and written from an executor thread.
+    Each report is written to a temporary file and then renamed, and is skipped if its content did not change
+    since the last write. Reports that could not be written are marked as dirty again, for the next flush.
+
+    When the references of an author are split between consumer lanes (see slow_lane), each lane is given its name
+    and the same base path : the content of its reports is saved under lanes/<lane>/, and each report is written
+    merged with the reports of the other lanes for the same author.
+    """
+
+    def __init__(self, base_path: str, flush_interval: float = None, lane: str = None):
+        self.fs, self.base_path = fsspec.core.url_to_fs(base_path)
+        self.fs.makedirs(self.base_path, exist_ok=True)
+        self.flush_interval = flush_interval if flush_interval is not None \
+            else float(os.getenv("REPORTS_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL))
+        self.lane = lane
+        self._dirty: Dict[str, AuthorReportBuilder] = {}
+        self._hashes: Dict[str, str] = {}
+        # builders of the reports being written, and their content in lane mode
+        self._writing: Dict[str, AuthorReportBuilder] = {}
+        self._states: Dict[str, dict] = {}
+        self.written = 0
+        self.unchanged = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def mark_dirty(self, main_entity_id: str, report_builder: AuthorReportBuilder) -> None:
+        self._dirty[main_entity_id] = report_builder
+
+    def render_dirty(self) -> List[Tuple[str, str, str]]:
+        """
+        Render the dirty reports whose content changed
+
+        :return: (main entity id, report, content hash) tuples
+        """
+        dirty, self._dirty = self._dirty, {}
+        reports = []
+        for main_entity_id, report_builder in dirty.items():
+            try:
+                report = report_builder.render_report()
+                content_hash = hashlib.sha1(report.encode("utf-8")).hexdigest()
+                if self._hashes.get(main_entity_id) == content_hash:
+                    self.unchanged += 1
+                    continue
+                if self.lane:
+                    self._states[main_entity_id] = report_builder.to_state()
+            except Exception as e:
+                print(f"Error rendering report {main_entity_id}, retried at the next flush: {e}")
+                self._dirty.setdefault(main_entity_id, report_builder)
+                continue
+            reports.append((main_entity_id, report, content_hash))
+            self._writing[main_entity_id] = report_builder
+        return reports
+
+    def write(self, reports: List[Tuple[str, str, str]]) -> List[str]:
+        """
+        :return: the main entity ids of the reports that could not be written
+        """
+        failed = []
+        for main_entity_id, report, content_hash in reports:
+            path = f"{self.base_path}/{main_entity_id}.txt"
+            try:
+                if self.lane:
+                    report = self._merge_lanes(main_entity_id, report)
+                self._write_file(path, report)
+            except Exception as e:
+                print(f"Error writing report {path}, retried at the next flush: {e}")
+                failed.append(main_entity_id)
+                continue
+            self._hashes[main_entity_id] = content_hash
+            self.written += 1
+        return failed
+
+    def _write_file(self, path: str, content: str) -> None:
+        temporary_path = f"{path}.tmp"
+        with self.fs.open(temporary_path, "w") as f:
+            f.write(content)
+        self.fs.mv(temporary_path, path)
+
+    def _merge_lanes(self, main_entity_id: str, report: str) -> str:
+        """
+        Save the content of the report of this lane, and render it merged with the reports of the other lanes
+        """
+        state = self._states[main_entity_id]
+        lanes_path = f"{self.base_path}/{LANES_DIR}"
+        self.fs.makedirs(f"{lanes_path}/{self.lane}", exist_ok=True)
+        self._write_file(f"{lanes_path}/{self.lane}/{main_entity_id}.json", json.dumps(state, default=str))
+        others = [path for path in self.fs.glob(f"{lanes_path}/*/{main_entity_id}.json")
+                  if path.rstrip("/").split("/")[-2] != self.lane]
+        if not others:
+            return report
+        states = [state] + [json.loads(self.fs.cat_file(path)) for path in sorted(others)]
+        return AuthorReportBuilder.from_states(states).render_report()
+
+    def _written(self, reports: List[Tuple[str, str, str]], failed: List[str]) -> None:
+        for main_entity_id in failed:
+            # a report marked dirty again meanwhile is rendered from the same builder
+            if main_entity_id in self._writing:
+                self._dirty.setdefault(main_entity_id, self._writing[main_entity_id])
+        for main_entity_id, _, _ in reports:
+            self._writing.pop(main_entity_id, None)
+            self._states.pop(main_entity_id, None)
+
+    def _restore_writing(self) -> None:
+        # outcome of the writes unknown : the reports are written again at the next flush
+        for main_entity_id, report_builder in self._writing.items():
+            self._dirty.setdefault(main_entity_id, report_builder)
+        self._writing.clear()
+        self._states.clear()
+
+    def flush(self) -> None:
+        reports = self.render_dirty()
+        self._written(reports, self.write(reports))
+
+    async def flush_periodically(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._flush_in_executor(loop)
+            except Exception as e:
+                # the flush loop must survive : reports of this flush are retried at the next one
+                print(f"Error flushing reports, retried at the next flush: {e}")
+                self._restore_writing()
+
+    async def _flush_in_executor(self, loop: asyncio.AbstractEventLoop) -> None:
+        with start_trace("report_flush", dirty=self.pending) as flush_span:
+            with span("render"):
+                reports = self.render_dirty()
+            flush_span.set_attribute("changed", len(reports))
+            if reports:
+                with span("write") as write_span:
+                    failed = await loop.run_in_executor(None, contextvars.copy_context().run, self.write, reports)
+                    write_span.set_attribute("failed", len(failed))
+                self._written(reports, failed)
+        if reports:
+            print(f"{len(reports)} reports written, {self.written} written / {self.unchanged} unchanged so far")
@@ -1,5 +1,9 @@
 import re
 import unicodedata
+from functools import lru_cache
+from typing import List
+
+import numpy as np
 
 from commons.models import Reference
 
@@ -29,7 +33,9 @@ class SimpleDuplicateDetector:
         return True
 
     @staticmethod
+    @lru_cache(maxsize=65536)
     def normalize_text(text: str) -> str:
+        # memoized : the same titles and contributor names are normalized for every candidate
         # Convert to normalized form, removing accents
         text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('utf-8')
 
@@ -111,10 +117,129 @@ class SimpleDuplicateDetector:
         uris_2 = {url.lower() for url in uris_2}
         return bool(uris_1.intersection(uris_2))
 
-    def remove_trailing_id(self, url: str) -> str:
+    @staticmethod
+    def remove_trailing_id(url: str) -> str:
         return re.sub(r'/id$', '', url)
 
-    def remove_doi_prefix(self, identifier: tuple) -> tuple:
+    @staticmethod
+    def remove_doi_prefix(identifier: tuple) -> tuple:
         if identifier[0] == 'doi':
             return ('doi', re.sub(r'^https?://doi.org/', '', identifier[1]))
         return identifier
+
+
+def identifier_keys(reference: Reference) -> frozenset:
+    identifiers = {SimpleDuplicateDetector.remove_doi_prefix((ident.type, ident.value))
+                   for ident in reference.identifiers}
+    return frozenset((ident[0].lower(), ident[1].lower()) for ident in identifiers)
+
+
+def isbn_keys(reference: Reference) -> tuple:
+    if not reference.book:
+        return None
+    isbn13, isbn10 = reference.book.isbn13, reference.book.isbn10
+    return (isbn13.strip() if isinstance(isbn13, str) else None,
+            isbn10.strip() if isinstance(isbn10, str) else None)
+
+
+def uri_keys(reference: Reference) -> frozenset:
+    uris = {manifestation.page for manifestation in reference.manifestations}
+    uris.update(ident.value for ident in reference.identifiers if ident.type == 'uri')
+    return frozenset(SimpleDuplicateDetector.remove_trailing_id(url).lower() for url in uris)
+
+
+def title_keys(reference: Reference) -> frozenset:
+    return frozenset(SimpleDuplicateDetector.normalize_text(title.value) for title in reference.titles)
+
+
+def abstract_keys(reference: Reference) -> frozenset:
+    return frozenset(SimpleDuplicateDetector.normalize_text(abstract.value) for abstract in reference.abstracts)
+
+
+def document_type_keys(reference: Reference) -> frozenset:
+    return frozenset(doc_type.label for doc_type in reference.document_type)
+
+
+def contributor_keys(reference: Reference) -> frozenset:
+    return frozenset(SimpleDuplicateDetector.normalize_text(contrib.contributor.name)
+                     for contrib in reference.contributions)
+
+
+class BatchDuplicateDetector:
+    """
+    Duplicate verdicts of one reference against N candidates at once, identical to the pairwise
+    SimpleDuplicateDetector verdicts.
+
+    The keys of the reference are computed once. Rules are applied in the same order as in the pairwise detector,
+    each one only to the candidates it may still decide : the keys of these candidates are hashed into arrays
+    and compared with vectorized equality and membership tests, hash matches being confirmed on the keys themselves.
+    """
+
+    def __init__(self, reference: Reference):
+        self.reference = reference
+
+    @staticmethod
+    def _equal(reference_keys: frozenset, candidate_keys: List[frozenset]) -> np.ndarray:
+        hashes = np.fromiter((hash(keys) for keys in candidate_keys), dtype=np.int64, count=len(candidate_keys))
+        matches = hashes == hash(reference_keys)
+        for index in np.flatnonzero(matches):
+            matches[index] = candidate_keys[index] == reference_keys
+        return matches
+
+    @staticmethod
+    def _intersect(reference_keys: frozenset, candidate_keys: List[frozenset]) -> np.ndarray:
+        matches = np.zeros(len(candidate_keys), dtype=bool)
+        if not reference_keys:
+            return matches
+        owners = np.fromiter((index for index, keys in enumerate(candidate_keys) for _ in keys), dtype=np.int64)
+        hashes = np.fromiter((hash(key) for keys in candidate_keys for key in keys), dtype=np.int64,
+                             count=len(owners))
+        reference_hashes = np.fromiter((hash(key) for key in reference_keys), dtype=np.int64)
+        matches[owners[np.isin(hashes, reference_hashes)]] = True
+        for index in np.flatnonzero(matches):
+            matches[index] = not candidate_keys[index].isdisjoint(reference_keys)
+        return matches
+
+    @staticmethod
+    def _same_isbn(reference_isbns: tuple, candidate_isbns: List[tuple]) -> np.ndarray:
+        if reference_isbns is None:
+            return np.zeros(len(candidate_isbns), dtype=bool)
+        return np.fromiter(
+            (isbns is not None and any(isbn is not None and isbn == reference_isbn
+                                       for isbn, reference_isbn in zip(isbns, reference_isbns))
+             for isbns in candidate_isbns), dtype=bool, count=len(candidate_isbns))
+
+    def are_duplicates(self, candidates: List[Reference]) -> List[bool]:
+        reference = self.reference
+        verdicts = np.zeros(len(candidates), dtype=bool)
+        undecided = np.arange(len(candidates))
+
+        def keys_of(key_function, indexes):
+            return [key_function(candidates[index]) for index in indexes]
+
+        # identifiers, ISBN and manifestations : a single match is enough to be a duplicate
+        for reference_keys, key_function, compare in (
+                (identifier_keys(reference), identifier_keys, self._intersect),
+                (isbn_keys(reference), isbn_keys, self._same_isbn),
+                (uri_keys(reference), uri_keys, self._intersect),
+        ):
+            matches = compare(reference_keys, keys_of(key_function, undecided))
+            verdicts[undecided[matches]] = True
+            undecided = undecided[~matches]
+
+        # titles, abstracts, document types and contributors : every test must pass
+        undecided = undecided[self._equal(title_keys(reference), keys_of(title_keys, undecided))]
+        if reference.abstracts:
+            with_abstracts = np.fromiter((bool(candidates[index].abstracts) for index in undecided), dtype=bool,
+                                         count=len(undecided))
+            different = ~self._equal(abstract_keys(reference), keys_of(abstract_keys, undecided[with_abstracts]))
+            undecided = np.setdiff1d(undecided, undecided[with_abstracts][different], assume_unique=True)
+        if reference.document_type:
+            with_types = np.fromiter((bool(candidates[index].document_type) for index in undecided), dtype=bool,
+                                     count=len(undecided))
+            disjoint = ~self._intersect(document_type_keys(reference),
+                                        keys_of(document_type_keys, undecided[with_types]))
+            undecided = np.setdiff1d(undecided, undecided[with_types][disjoint], assume_unique=True)
+        undecided = undecided[self._equal(contributor_keys(reference), keys_of(contributor_keys, undecided))]
+        verdicts[undecided] = True
+        return verdicts.tolist()
@@ -0,0 +1,178 @@
+"""
+Slow lane of the consumer : routing of the expensive messages to a separate queue, and measures of the cost model.
+
+Every processed message is appended to SLOW_LANE_MEASURES_FILE (rotated by size) with the features of the cost
+model and its processing time. The cost budget matching the time budget is fitted from these measures with :
+
+Usage : python -m slow_lane measures/lane_measures.jsonl [measures/lane_measures.jsonl.1 ...] [--time-budget 5]
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from typing import List
+
+import aio_pika
+
+from commons.models import Reference
+
+SLOW_LANE_QUEUE_NAME = "ctd-publications-slow"
+# does not match the topic of the main queue
+SLOW_LANE_ROUTING_KEY = "ctd.slow-lane"
+DEFAULT_TIME_BUDGET = 5.0
+DEFAULT_MEASURES_FILE = "measures/lane_measures.jsonl"
+DEFAULT_MEASURES_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_MEASURES_BACKUP_COUNT = 3
+
+# cost units of the features slowing down the strategies and the comparison tables
+COST_PER_CONTRIBUTOR = 1.0
+COST_PER_ABSTRACT_CHARACTER = 0.01
+COST_PER_TITLE = 5.0
+
+
+def cost_features(reference: Reference) -> dict:
+    return {"contributors": len(reference.contributions),
+            "abstract_characters": sum(len(abstract.value) for abstract in reference.abstracts),
+            "titles": len(reference.titles)}
+
+
+def estimate_cost(reference: Reference) -> float:
+    """
+    Cost of a reference through the strategies, estimated before processing
+    from its contributor count, abstract length and title count
+    """
+    features = cost_features(reference)
+    return (features["contributors"] * COST_PER_CONTRIBUTOR
+            + features["abstract_characters"] * COST_PER_ABSTRACT_CHARACTER
+            + features["titles"] * COST_PER_TITLE)
+
+
+class MeasuresExporter:
+    """
+    Appends one JSON line per processed message to a file rotated by size
+    """
+
+    def __init__(self, path: str = None):
+        path = path or os.getenv("SLOW_LANE_MEASURES_FILE", DEFAULT_MEASURES_FILE)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=DEFAULT_MEASURES_MAX_BYTES,
+                                      backupCount=DEFAULT_MEASURES_BACKUP_COUNT)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger(f"{__name__}.measures")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(handler)
+
+    def export(self, measure: dict) -> None:
+        self.logger.info(json.dumps(measure))
+
+
+class SlowLaneRouter:
+    """
+    Republishes the messages whose estimated cost exceeds SLOW_LANE_COST_BUDGET to the slow lane queue,
+    consumed by a separate worker (CONSUMER_LANE=slow), so that they do not hold up the main queue.
+
+    Processing times are measured in both lanes : main lane messages exceeding SLOW_LANE_TIME_BUDGET
+    are counted as estimation misses, and every message is exported with its cost features and processing time,
+    to calibrate the cost budget.
+    """
+
+    def __init__(self, exchange, lane: str = "main", cost_budget: float = None, time_budget: float = None):
+        self.exchange = exchange
+        self.lane = lane
+        cost_budget = cost_budget or os.getenv("SLOW_LANE_COST_BUDGET")
+        # routing is disabled without a cost budget
+        self.cost_budget = float(cost_budget) if cost_budget else None
+        self.time_budget = time_budget or float(os.getenv("SLOW_LANE_TIME_BUDGET", DEFAULT_TIME_BUDGET))
+        self.counters = Counter()
+        self.max_duration = 0.0
+        self._exporter = None
+
+    def is_over_budget(self, reference: Reference) -> bool:
+        return self.cost_budget is not None and estimate_cost(reference) > self.cost_budget
+
+    async def reroute(self, message: aio_pika.IncomingMessage, reference: Reference) -> None:
+        await self.exchange.publish(
+            aio_pika.Message(body=message.body,
+                             headers=(message.headers or {}) | {"x-estimated-cost": estimate_cost(reference)},
+                             content_type=message.content_type,
+                             delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+            routing_key=SLOW_LANE_ROUTING_KEY,
+        )
+        self.counters["rerouted"] += 1
+        print(f"Reference {reference.unique_identifier()} rerouted to the slow lane "
+              f"(estimated cost {estimate_cost(reference):.0f})")
+
+    @property
+    def exporter(self) -> MeasuresExporter:
+        if self._exporter is None:
+            self._exporter = MeasuresExporter()
+        return self._exporter
+
+    def record(self, reference: Reference, duration: float) -> None:
+        try:
+            self.exporter.export({"at": time.time(), "lane": self.lane, "reference": reference.unique_identifier(),
+                                  **cost_features(reference), "estimated_cost": estimate_cost(reference),
+                                  "duration": duration})
+        except Exception as e:
+            print(f"Error exporting the measures of {reference.unique_identifier()}: {e}")
+        self.counters["processed"] += 1
+        self.max_duration = max(self.max_duration, duration)
+        if duration > self.time_budget:
+            self.counters["over_time_budget"] += 1
+            print(f"Reference {reference.unique_identifier()} took {duration:.1f}s "
+                  f"(estimated cost {estimate_cost(reference):.0f})")
+
+    def stats(self) -> dict:
+        return {
+            "cost_budget": self.cost_budget,
+            "time_budget": self.time_budget,
+            "max_duration": self.max_duration,
+            **self.counters,
+        }
+
+
+def read_measures(paths: List[str]) -> List[dict]:
+    measures = []
+    for path in paths:
+        with open(path) as f:
+            measures.extend(json.loads(line) for line in f if line.strip())
+    return measures
+
+
+def calibrate(measures: List[dict], time_budget: float) -> dict:
+    """
+    Least squares fit of the processing time on the estimated cost, and on each feature of the cost model
+    """
+    import numpy as np
+
+    durations = np.array([measure["duration"] for measure in measures])
+    costs = np.array([measure["estimated_cost"] for measure in measures])
+    (seconds_per_cost, overhead), *_ = np.linalg.lstsq(np.column_stack([costs, np.ones_like(costs)]), durations,
+                                                       rcond=None)
+    residuals = durations - (seconds_per_cost * costs + overhead)
+    features = np.array([[measure["contributors"], measure["abstract_characters"], measure["titles"], 1.0]
+                         for measure in measures])
+    per_feature, *_ = np.linalg.lstsq(features, durations, rcond=None)
+    return {
+        "messages": len(measures),
+        "seconds_per_cost_unit": float(seconds_per_cost),
+        "overhead": float(overhead),
+        "r2": float(1 - residuals.var() / durations.var()) if durations.var() > 0 else None,
+        "cost_budget": float((time_budget - overhead) / seconds_per_cost) if seconds_per_cost > 0 else None,
+        "seconds_per_contributor": float(per_feature[0]),
+        "seconds_per_abstract_character": float(per_feature[1]),
+        "seconds_per_title": float(per_feature[2]),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cost budget of the slow lane, fitted from the exported measures")
+    parser.add_argument("paths", nargs="+", help="measures files exported by the consumers")
+    parser.add_argument("--time-budget", type=float,
+                        default=float(os.getenv("SLOW_LANE_TIME_BUDGET", DEFAULT_TIME_BUDGET)))
+    args = parser.parse_args()
+    print(json.dumps(calibrate(read_measures(args.paths), args.time_budget), indent=2))
@@ -0,0 +1,248 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Tuple
+
+from commons.circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from commons.models import Entity, Reference, Result
+from commons.profiling import profiled
+from commons.tracing import span
+from simple_duplicate_detector import SimpleDuplicateDetector
+from strategies.registry import StrategyRegistry
+from strategies.similarity_strategy import SimilarityStrategy
+
+
+def _dois(reference: Reference) -> set:
+    return {re.sub(r'^https?://doi.org/', '', identifier.value).lower()
+            for identifier in reference.identifiers if identifier.type.lower() == "doi"}
+
+
+def trivial_duplicate(reference: Reference, candidates: List[Result]) -> bool:
+    return any(SimpleDuplicateDetector(candidate.reference1, candidate.reference2).is_duplicate()
+               for candidate in candidates)
+
+
+def trivial_duplicate_with_same_doi(reference: Reference, candidates: List[Result]) -> bool:
+    dois = _dois(reference)
+    if not dois:
+        return False
+    return any(dois & _dois(candidate.reference2)
+               and SimpleDuplicateDetector(candidate.reference1, candidate.reference2).is_duplicate()
+               for candidate in candidates)
+
+
+DEFAULT_STRATEGY_TIMEOUT = 10.0
+DEFAULT_CIRCUIT_BREAKER_FAILURES = 3
+DEFAULT_CIRCUIT_BREAKER_RESET_TIMEOUT = 30.0
+DEFAULT_PROBE_INTERVAL = 5.0
+DEFAULT_MAX_DEFERRED_LOADS = 10000
+DEFAULT_DEFERRED_LOADS_BATCH = 20
+
+# conditions, evaluated on the candidates found by the previous stages, under which a stage may be skipped
+SKIP_CONDITIONS: Dict[str, Callable[[Reference, List[Result]], bool]] = {
+    "trivial_duplicate": trivial_duplicate,
+    "trivial_duplicate_with_same_doi": trivial_duplicate_with_same_doi,
+}
+
+
+def parse_skip_rules(rules: str) -> List[Tuple[str, str]]:
+    """
+    Parse "stage:condition" pairs separated by commas,
+    e.g. "notice_semantic:trivial_duplicate_with_same_doi,title_semantic:trivial_duplicate_with_same_doi"
+    """
+    parsed = []
+    for rule in filter(None, (rule.strip() for rule in rules.split(","))):
+        stage, condition = (part.strip() for part in rule.split(":", 1))
+        if condition not in SKIP_CONDITIONS:
+            raise ValueError(f"Unknown skip condition: {condition}, available: {list(SKIP_CONDITIONS)}")
+        parsed.append((stage, condition))
+    return parsed
+
+
+class StrategyCascade:
+    """
+    Runs the strategies from the cheapest to the most expensive cost class,
+    skipping the queries of later stages when a configured rule holds on the candidates found so far.
+
+    References are always loaded into every strategy index, whether the query is skipped or not.
+
+    Each stage runs within a time budget (STRATEGY_TIMEOUT, or STRATEGY_TIMEOUT_<STAGE>) behind a circuit breaker :
+    a stage that fails, times out or is open is reported as degraded and the message goes on with the others.
+    The references that could not be loaded meanwhile are kept (at most CASCADE_MAX_DEFERRED_LOADS per stage)
+    and loaded by batches of CASCADE_DEFERRED_LOADS_BATCH once the breaker is closed again.
+    """
+
+    def __init__(self, registry: StrategyRegistry, rules: List[Tuple[str, str]] = None):
+        self.registry = registry
+        self.rules = rules if rules is not None else parse_skip_rules(os.getenv("CASCADE_SKIP_RULES", ""))
+        self.runs = Counter()
+        self.skips: Dict[str, Counter] = defaultdict(Counter)
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        max_deferred_loads = int(os.getenv("CASCADE_MAX_DEFERRED_LOADS", DEFAULT_MAX_DEFERRED_LOADS))
+        self.deferred_loads_batch = int(os.getenv("CASCADE_DEFERRED_LOADS_BATCH", DEFAULT_DEFERRED_LOADS_BATCH))
+        self._deferred_loads: Dict[str, deque] = defaultdict(lambda: deque(maxlen=max_deferred_loads))
+        self._reloading = set()
+
+    def stages(self) -> List[Tuple[str, SimilarityStrategy]]:
+        # sorted is stable : declaration order is kept within a cost class
+        return sorted(self.registry.items(), key=lambda item: item[1].COST)
+
+    @staticmethod
+    def _stage_setting(name: str, stage: str, default: float | None) -> float | None:
+        value = os.getenv(f"{name}_{stage.upper()}", os.getenv(name))
+        return float(value) if value else default
+
+    def _breaker(self, stage: str) -> CircuitBreaker:
+        if stage not in self.breakers:
+            self.breakers[stage] = CircuitBreaker(
+                stage,
+                failure_threshold=int(os.getenv("CIRCUIT_BREAKER_FAILURES", DEFAULT_CIRCUIT_BREAKER_FAILURES)),
+                slow_call_duration=self._stage_setting("STRATEGY_SLOW_CALL", stage, None),
+                reset_timeout=float(os.getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", DEFAULT_CIRCUIT_BREAKER_RESET_TIMEOUT)),
+            )
+        return self.breakers[stage]
+
+    def _executor(self, stage: str) -> ThreadPoolExecutor:
+        # one worker per stage : a stuck call makes the following ones time out instead of piling up
+        if stage not in self._executors:
+            self._executors[stage] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"strategy-{stage}")
+        return self._executors[stage]
+
+    def _call_with_deadline(self, stage: str, function: Callable[[], List[Result]]) -> List[Result]:
+        # the copied context carries the current trace span into the worker thread
+        # and the call is profiled in the worker thread while a /debug/profile session is running
+        future = self._executor(stage).submit(contextvars.copy_context().run, profiled(function))
+        try:
+            return future.result(timeout=self._stage_setting("STRATEGY_TIMEOUT", stage, DEFAULT_STRATEGY_TIMEOUT))
+        finally:
+            future.cancel()
+
+    def _defer_load(self, stage: str, entity: Entity, reference: Reference) -> None:
+        deferred_loads = self._deferred_loads[stage]
+        if len(deferred_loads) == deferred_loads.maxlen:
+            print(f"Too many references waiting to be loaded into {stage}, the oldest one is dropped")
+        deferred_loads.append((entity, reference))
+
+    def _load_deferred(self, stage: str, strategy: SimilarityStrategy) -> None:
+        """
+        Load a batch of the references deferred while the stage was unavailable, in the stage worker thread
+        """
+        deferred_loads = self._deferred_loads[stage]
+        try:
+            for _ in range(self.deferred_loads_batch):
+                if not deferred_loads:
+                    return
+                entity, reference = deferred_loads.popleft()
+                try:
+                    strategy.load_reference(entity, reference)
+                except Exception as e:
+                    print(f"Error loading a deferred reference into {stage}: {e}")
+                    deferred_loads.appendleft((entity, reference))
+                    return
+        finally:
+            self._reloading.discard(stage)
+
+    def _schedule_deferred_loads(self, stage: str, strategy: SimilarityStrategy) -> None:
+        if not self._deferred_loads[stage] or stage in self._reloading:
+            return
+        self._reloading.add(stage)
+        self._executor(stage).submit(self._load_deferred, stage, strategy)
+
+    def _skip_condition(self, stage: str, reference: Reference, candidates: List[Result]) -> str | None:
+        for rule_stage, condition in self.rules:
+            if rule_stage == stage and SKIP_CONDITIONS[condition](reference, candidates):
+                return condition
+        return None
+
+    def run(self, entity: Entity, reference: Reference) -> Tuple[List[Result], List[str]]:
+        """
+        :return: the candidates, and the stages that could not contribute to them
+        """
+        candidates: List[Result] = []
+        degraded: List[str] = []
+        for stage, strategy in self.stages():
+            breaker = self._breaker(stage)
+            if not getattr(strategy, "initialization_success", True) and breaker.state != OPEN:
+                # let the background probe retry the initialization
+                breaker.force_open()
+            if not breaker.allow():
+                self._defer_load(stage, entity, reference)
+                degraded.append(stage)
+                continue
+            condition = self._skip_condition(stage, reference, candidates)
+
+            def call(stage=stage, strategy=strategy, condition=condition) -> List[Result]:
+                with span(f"strategy.{stage}", cost=strategy.COST.name, skipped=condition or "") as stage_span:
+                    with span("load_reference"):
+                        try:
+                            strategy.load_reference(entity, reference)
+                        except Exception:
+                            self._defer_load(stage, entity, reference)
+                            raise
+                    if condition:
+                        return []
+                    with span("query"):
+                        results = list(strategy.get_similar_references(entity, reference))
+                    stage_span.set_attribute("candidates", len(results))
+                    return results
+
+            start = time.perf_counter()
+            try:
+                stage_candidates = self._call_with_deadline(stage, call)
+            except FutureTimeoutError:
+                print(f"Strategy {stage} exceeded its time budget")
+                breaker.record_failure()
+                degraded.append(stage)
+                continue
+            except Exception as e:
+                print(f"Error in strategy {stage}: {e}")
+                breaker.record_failure()
+                degraded.append(stage)
+                continue
+            breaker.record_success(time.perf_counter() - start)
+            if breaker.state == CLOSED:
+                self._schedule_deferred_loads(stage, strategy)
+            if condition:
+                self.skips[stage][condition] += 1
+                print(f"Skipping {stage} ({condition}), {sum(self.skips[stage].values())} skips "
+                      f"/ {self.runs[stage]} runs")
+                continue
+            self.runs[stage] += 1
+            candidates.extend(stage_candidates)
+        return candidates, degraded
+
+    def start_probing(self, interval: float = None) -> None:
+        """
+        Re-probe the strategies behind open circuit breakers in a background thread
+        """
+        interval = interval or float(os.getenv("STRATEGY_PROBE_INTERVAL", DEFAULT_PROBE_INTERVAL))
+        threading.Thread(target=self._probe_periodically, args=(interval,), name="strategy-probe",
+                         daemon=True).start()
+
+    def _probe_periodically(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            for stage, strategy in self.registry.items():
+                breaker = self.breakers.get(stage)
+                if not breaker or not breaker.should_probe():
+                    continue
+                try:
+                    reachable = strategy.probe()
+                except Exception as e:
+                    print(f"Probe of strategy {stage} failed: {e}")
+                    reachable = False
+                if reachable:
+                    breaker.probe_succeeded()
+                else:
+                    breaker.probe_failed()
+
+    def stats(self) -> Dict[str, dict]:
+        return {stage: {"runs": self.runs[stage], "skips": dict(self.skips[stage]),
+                        "breaker": self.breakers[stage].state if stage in self.breakers else None,
+                        "deferred_loads": len(self._deferred_loads[stage])}
+                for stage, _ in self.stages()}
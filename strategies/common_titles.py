@@ -1,12 +1,73 @@
 # declare a list of common titles for the strategies
 # this title ("Préface", "Introduction") are common titles that are not relevant for the similarity
+import os
+import threading
+import time
+
 from simple_duplicate_detector import SimpleDuplicateDetector
 
 COMMON_TITLES = ["Préface", "Introduction", "Preface"]
 
+NORMALIZED_COMMON_TITLES = frozenset(SimpleDuplicateDetector.normalize_text(title) for title in COMMON_TITLES)
+
+# number of references sharing a title for it to be considered as frequent
+DEFAULT_MIN_TITLE_FREQUENCY = 20
+DEFAULT_STOPLIST_SIZE = 1000
+DEFAULT_STOPLIST_REFRESH_INTERVAL = 3600
+
 
 def common_titles(titles):
-    return all(
-        SimpleDuplicateDetector.normalize_text(title) in
-        [SimpleDuplicateDetector.normalize_text(common_title) for common_title in COMMON_TITLES]
-        for title in titles)
+    return all(SimpleDuplicateDetector.normalize_text(title) in NORMALIZED_COMMON_TITLES for title in titles)
+
+
+class CommonTitleStoplist:
+    """
+    Titles shared by many references of an index ("Editorial", "Compte rendu", "Avant-propos"...),
+    which are too frequent to be searched by title alone.
+
+    The stoplist is built from the title frequencies of the index (terms aggregation on the title keyword field),
+    stored as a set of normalized titles and refreshed periodically in a background thread.
+    Until the first refresh, it only contains the common titles.
+    """
+
+    def __init__(self, es, index: str, min_frequency: int = None, size: int = None):
+        self.es = es
+        self.index = index
+        self.min_frequency = min_frequency or int(os.getenv("COMMON_TITLES_MIN_FREQUENCY",
+                                                            DEFAULT_MIN_TITLE_FREQUENCY))
+        self.size = size or int(os.getenv("COMMON_TITLES_STOPLIST_SIZE", DEFAULT_STOPLIST_SIZE))
+        self.titles = NORMALIZED_COMMON_TITLES
+        self.refreshed_at = None
+
+    def __contains__(self, title: str) -> bool:
+        return SimpleDuplicateDetector.normalize_text(title) in self.titles
+
+    def refresh(self) -> None:
+        response = self.es.search(index=self.index, size=0, aggs={
+            "frequent_titles": {
+                "terms": {
+                    "field": "titles.value.keyword",
+                    "size": self.size,
+                    "min_doc_count": self.min_frequency,
+                }
+            }
+        })
+        frequent_titles = {SimpleDuplicateDetector.normalize_text(bucket["key"])
+                           for bucket in response["aggregations"]["frequent_titles"]["buckets"]}
+        # the set is replaced, never updated in place, as it is read from other threads
+        self.titles = NORMALIZED_COMMON_TITLES | frozenset(frequent_titles)
+        self.refreshed_at = time.time()
+        print(f"Common titles stoplist of {self.index} refreshed : {len(self.titles)} titles")
+
+    def start_refreshing(self, interval: float = None) -> None:
+        interval = interval or float(os.getenv("COMMON_TITLES_REFRESH_INTERVAL", DEFAULT_STOPLIST_REFRESH_INTERVAL))
+        threading.Thread(target=self._refresh_periodically, args=(interval,), name=f"stoplist-{self.index}",
+                         daemon=True).start()
+
+    def _refresh_periodically(self, interval: float) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing the common titles stoplist of {self.index}: {e}")
+            time.sleep(interval)
@@ -1,40 +1,64 @@
+import os
 from typing import Generator
 
 from commons.models import Entity, Reference, Result
+from strategies.similarity_strategy import CostClass
 from strategies.synctactic_similarity_strategy import SyntacticSimilarityStrategy
 
 SCORE_THRESHOLD = 180
 
 
 class MoreLikeThisSimilarityStrategy(SyntacticSimilarityStrategy):
+    COST = CostClass.MEDIUM
     ES_INDEX = "mld_syntactic_1"
+    INLINE_DOCUMENT = os.getenv("MLT_INLINE_DOCUMENT", "true").lower() == "true"
+    SEARCH_SIZE = int(os.getenv("MLT_SEARCH_SIZE", 10))
 
     def get_similar_references(
             self, entity: Entity, reference: Reference
     ) -> Generator[Result, None, None]:
         if not self.initialization_success:
             return
+        self._ensure_read_after_write()
+        identifier = reference.unique_identifier()
         fields = ["titles.value", "abstracts.value", "contributors.contributor.name", "subjects.pref_labels.value"]
+        if self.INLINE_DOCUMENT:
+            # the reference is passed as an artificial document : the query does not depend on it being indexed yet
+            like = [{"_index": self.ES_INDEX, "doc": self._like_document(reference)}]
+        else:
+            if self.indexer.is_pending(identifier):
+                self.indexer.flush()
+            like = [{"_index": self.ES_INDEX, "_id": identifier}]
         query = {
             "query": {
                 "more_like_this": {
                     "fields": fields,
-                    "like": [{"_index": self.ES_INDEX, "_id": reference.unique_identifier()}],
+                    "like": like,
                     "min_term_freq": 1,
                     "max_query_terms": 12,
                 }
-            }
+            },
+            # hits under the threshold are dropped by ES
+            "min_score": SCORE_THRESHOLD,
         }
 
-        query_results = self.es.search(index=self.ES_INDEX, body=query)
-        for result in query_results["hits"]["hits"]:
-            if result["_score"] >= SCORE_THRESHOLD:
-                yield Result(
-                    reference1=reference,
-                    reference2=Reference(**result["_source"]),
-                    scores=[result["_score"]],
-                    similarity_strategies=[self.get_name()]
-                )
+        # an artificial document does not exclude the indexed reference itself : the exclusions do
+        hits = self._search_hits(self._candidate_query(query, reference))
+        references = self._hydrate(hits)
+        for result in hits:
+            if result["_id"] not in references:
+                continue
+            yield Result(
+                reference1=reference,
+                reference2=references[result["_id"]],
+                scores=[result["_score"]],
+                similarity_strategies=[self.get_name()]
+            )
+
+    @staticmethod
+    def _like_document(reference: Reference) -> dict:
+        metadata = reference.dict()
+        return {field: metadata[field] for field in ["titles", "abstracts", "contributions", "subjects"]}
 
     def get_name(self) -> str:
         return f"Similarité syntaxique des notices : {SCORE_THRESHOLD} "
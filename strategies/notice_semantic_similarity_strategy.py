@@ -1,53 +1,19 @@
 from typing import Generator
 
-from elasticsearch import Elasticsearch
-from langchain.embeddings.huggingface import HuggingFaceEmbeddings
-from langchain.vectorstores.elasticsearch import ElasticsearchStore
-
-from commons.es_params import ESParams
 from commons.models import Entity, Reference, Result
-from strategies.similarity_strategy import SimilarityStrategy
+from strategies.semantic_similarity_strategy import SemanticSimilarityStrategy
 
 ES_INDEX = "notices_semantic_minilml12v2_1"
 
 
-class NoticeSemanticSimilarityStrategy(SimilarityStrategy):
+class NoticeSemanticSimilarityStrategy(SemanticSimilarityStrategy):
+    ES_INDEX = ES_INDEX
+    SETTINGS_PREFIX = "NOTICE_SEMANTIC"
+    INDEX_PATTERN = "notices_semantic_*"
     SIMILARITY_THRESHOLD = 0.96
 
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name="paraphrase-multilingual-MiniLM-L12-v2")
-        self.initialization_success = False
-        params = ESParams()
-        try:
-            es_connection = Elasticsearch(
-                [params.url],
-                http_auth=(params.user, params.password),
-                verify_certs=False,
-            )
-            self.elastic_vector_search = ElasticsearchStore(
-                index_name=ES_INDEX,
-                embedding=self.embeddings,
-                es_connection=es_connection
-            )
-            self.initialization_success = True
-        except Exception as e:
-            print(f"Error connecting to ES: {e}")
-            # display connexion parameters for debugging
-            print(f"ES URL: {params.url}")
-            print(f"ES User: {params.user}")
-            print(f"ES Password: {params.password}")
-
-    def load_reference(self, entity: Entity, reference: Reference):
-        if not self.initialization_success:
-            return
-        identifier = reference.unique_identifier()
-        summary = self._build_summary(entity, reference)
-        metadata = reference.dict() | {"id": identifier}
-        self.elastic_vector_search.add_texts([summary],
-                                             ids=[identifier],
-                                             metadatas=[
-                                                 metadata
-                                             ])
+    def _build_text(self, entity: Entity, reference: Reference) -> str:
+        return self._build_summary(entity, reference)
 
     def _build_summary(self, entity, reference):
         titles = " | ".join(
@@ -74,22 +40,23 @@ class NoticeSemanticSimilarityStrategy(SimilarityStrategy):
             return
         identifier = reference.unique_identifier()
         summary = self._build_summary(entity, reference)
-        search_results = self.elastic_vector_search.similarity_search_with_score(summary, k=20)
-        filtered_results = [document for document in search_results if
-                            document[1] > self.SIMILARITY_THRESHOLD
-                            and document[1] < 1
-                            and not document[0].metadata['id'] == identifier]
-        converted_results = [(Reference(**document[0].metadata), document[1]) for document in
-                             filtered_results]
-        deduplicated_results = [result for result in converted_results if
-                                not self._identifiers_from_same_source(reference, result[0])
-                                and not self._reference_with_common_identifier(reference,
-                                                                               result[0])]
-        for result in deduplicated_results:
+        hits = self._search_hits(summary, reference)
+        # identical vectors (score 1) and same-source hits are not excluded by ES, and the other checks are kept
+        # for values too long for the keyword subfields (over 256 characters)
+        filtered_hits = [hit for hit in hits if
+                         self.SIMILARITY_THRESHOLD < hit["_score"] < 1
+                         and not hit["_source"]["metadata"]['id'] == identifier]
+        deduplicated_hits = [hit for hit in filtered_hits if
+                             not self._identifiers_from_same_source(reference, self._summary(hit))
+                             and not self._reference_with_common_identifier(reference, self._summary(hit))]
+        references = self._hydrate(deduplicated_hits)
+        for hit in deduplicated_hits:
+            if hit["_id"] not in references:
+                continue
             yield Result(
                 reference1=reference,
-                reference2=result[0],
-                scores=[result[1]],
+                reference2=references[hit["_id"]],
+                scores=[hit["_score"]],
                 similarity_strategies=[self.get_name()]
             )
 
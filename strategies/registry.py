@@ -0,0 +1,106 @@
+import asyncio
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from strategies.similarity_strategy import SimilarityStrategy
+
+# Strategies are declared by their dotted path so that their modules (and their heavy dependencies :
+# langchain, sentence-transformers, elasticsearch clients) are only imported when they are built.
+# The declaration order breaks ties between strategies of the same cost class (see strategies.cascade).
+STRATEGY_REGISTRY = {
+    "notice_semantic": "strategies.notice_semantic_similarity_strategy.NoticeSemanticSimilarityStrategy",
+    "title_semantic": "strategies.title_semantic_similarity_strategy.TitleSemanticSimilarityStrategy",
+    "title_syntactic": "strategies.title_syntactic_similarity_strategy.TitleSyntacticSimilarityStrategy",
+    "more_like_this": "strategies.more_like_this_similarity_strategy.MoreLikeThisSimilarityStrategy",
+}
+
+
+def get_enabled_strategy_names() -> List[str]:
+    """
+    Names of the strategies to build, from the comma separated SIMILARITY_STRATEGIES env variable
+    (all registered strategies by default)
+    """
+    names = os.getenv("SIMILARITY_STRATEGIES")
+    if not names:
+        return list(STRATEGY_REGISTRY)
+    names = [name.strip() for name in names.split(",") if name.strip()]
+    unknown = [name for name in names if name not in STRATEGY_REGISTRY]
+    if unknown:
+        raise ValueError(f"Unknown similarity strategies: {unknown}, available: {list(STRATEGY_REGISTRY)}")
+    return names
+
+
+def build_strategy(name: str) -> SimilarityStrategy:
+    module_path, class_name = STRATEGY_REGISTRY[name].rsplit(".", 1)
+    strategy_class = getattr(importlib.import_module(module_path), class_name)
+    return strategy_class()
+
+
+class StrategyRegistry:
+    """
+    Builds the similarity strategies lazily, in parallel and off the event loop,
+    so that the health server can answer liveness probes while models are loading.
+    """
+
+    def __init__(self, names: List[str] = None, max_workers: int = None):
+        self.names = names if names is not None else get_enabled_strategy_names()
+        self.max_workers = max_workers or int(os.getenv("STRATEGIES_INIT_WORKERS", len(self.names) or 1))
+        self.init_durations: Dict[str, float] = {}
+        self._strategies: Dict[str, SimilarityStrategy] = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def strategies(self) -> List[SimilarityStrategy]:
+        """
+        Built strategies, in declaration order
+        """
+        return [self._strategies[name] for name in self.names if name in self._strategies]
+
+    def items(self) -> List[Tuple[str, SimilarityStrategy]]:
+        """
+        (name, strategy) pairs of the built strategies, in declaration order
+        """
+        return [(name, self._strategies[name]) for name in self.names if name in self._strategies]
+
+    def get(self, name: str) -> SimilarityStrategy:
+        return self._strategies.get(name)
+
+    def _build(self, name: str) -> None:
+        start = time.perf_counter()
+        try:
+            strategy = build_strategy(name)
+        except Exception as e:
+            print(f"Error building strategy {name}: {e}")
+            return
+        finally:
+            self.init_durations[name] = time.perf_counter() - start
+        with self._lock:
+            self._strategies[name] = strategy
+        print(f"Strategy {name} built in {self.init_durations[name]:.2f}s")
+
+    def initialize(self) -> None:
+        """
+        Build all enabled strategies, blocking until they are all available
+        """
+        if self.ready:
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix="strategy-init") as executor:
+            list(executor.map(self._build, self.names))
+        self._ready.set()
+
+    async def initialize_in_background(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.initialize)
+
+    async def wait_until_ready(self, poll_interval: float = 0.5) -> None:
+        while not self.ready:
+            await asyncio.sleep(poll_interval)
@@ -0,0 +1,196 @@
+import os
+from abc import abstractmethod
+from typing import Dict, List
+
+from elasticsearch import NotFoundError
+
+from commons.content_hash_registry import ContentHashRegistry
+from commons.embeddings import EMBEDDINGS_DIMS, get_embeddings
+from commons.es_params import ESParams, get_es_client
+from commons.models import Entity, Reference, ReferenceSummary
+from commons.tracing import span
+from strategies.similarity_strategy import SimilarityStrategy, CostClass
+
+
+class SemanticSimilarityStrategy(SimilarityStrategy):
+    # each query requires the embedding of the reference
+    COST = CostClass.HIGH
+    ES_INDEX: str
+    # prefix of the index settings, e.g. NOTICE_SEMANTIC_K
+    SETTINGS_PREFIX: str
+    # indexes of all versions of the strategy index, created from the same template
+    INDEX_PATTERN: str
+    SIMILARITY_THRESHOLD = 0.96
+    # number of nearest neighbours and of HNSW candidates per shard, as in langchain similarity_search_with_score,
+    # overridable with <SETTINGS_PREFIX>_K and <SETTINGS_PREFIX>_NUM_CANDIDATES
+    K = 20
+    NUM_CANDIDATES = 50
+    # HNSW graph of the vectors : int8 quantization divides the vector memory by 4
+    VECTOR_INDEX_TYPE = os.getenv("SEMANTIC_VECTOR_INDEX_TYPE", "int8_hnsw")
+    HNSW_M = int(os.getenv("SEMANTIC_HNSW_M", 16))
+    HNSW_EF_CONSTRUCTION = int(os.getenv("SEMANTIC_HNSW_EF_CONSTRUCTION", 100))
+    # metadata fields needed to filter hits before fetching the full references
+    SUMMARY_FIELDS = ["metadata.id", "metadata.source_identifier", "metadata.identifiers", "metadata.titles",
+                      "metadata.content_hash"]
+    # metadata fields are dynamically mapped as text with a keyword subfield
+    FIELD_PREFIX = "metadata."
+    KEYWORD_SUFFIX = ".keyword"
+    EXCLUDE_COMMON_IDENTIFIERS = True
+
+    def __init__(self):
+        self.embeddings = get_embeddings()
+        self.initialization_success = False
+        self.content_hashes = ContentHashRegistry(self.ES_INDEX)
+        self.two_phase_retrieval = os.getenv("TWO_PHASE_RETRIEVAL", "true").lower() == "true"
+        self.k = int(os.getenv(f"{self.SETTINGS_PREFIX}_K", self.K))
+        self.num_candidates = max(self.k, int(os.getenv(f"{self.SETTINGS_PREFIX}_NUM_CANDIDATES",
+                                                        self.NUM_CANDIDATES)))
+        self._connect()
+
+    @classmethod
+    def index_template(cls) -> dict:
+        """
+        Composable index template of the strategy indexes : same layout as the indexes created by langchain
+        ElasticsearchStore, with explicit HNSW parameters
+        """
+        return {
+            "index_patterns": [cls.INDEX_PATTERN],
+            "priority": 100,
+            "template": {
+                "mappings": {
+                    "properties": {
+                        "text": {"type": "text"},
+                        "vector": {
+                            "type": "dense_vector",
+                            "dims": EMBEDDINGS_DIMS,
+                            "index": True,
+                            "similarity": "cosine",
+                            "index_options": {
+                                "type": cls.VECTOR_INDEX_TYPE,
+                                "m": cls.HNSW_M,
+                                "ef_construction": cls.HNSW_EF_CONSTRUCTION,
+                            },
+                        },
+                    }
+                }
+            },
+        }
+
+    @classmethod
+    def put_index_template(cls, client) -> None:
+        client.indices.put_index_template(name=cls.INDEX_PATTERN.rstrip("*_"), **cls.index_template())
+
+    def _connect(self):
+        # langchain is heavy to import : defer it until the strategy is actually built
+        from langchain.vectorstores.elasticsearch import ElasticsearchStore
+        params = ESParams()
+        try:
+            client = get_es_client()
+            self.put_index_template(client)
+            # created from the template, before ElasticsearchStore would create it with its default mapping
+            if not client.indices.exists(index=self.ES_INDEX):
+                client.indices.create(index=self.ES_INDEX)
+            self.content_hashes.bind(client)
+            self.elastic_vector_search = ElasticsearchStore(
+                index_name=self.ES_INDEX,
+                embedding=self.embeddings,
+                es_connection=client
+            )
+            self.initialization_success = True
+        except Exception as e:
+            print(f"Error connecting to ES: {e}")
+            # display connexion parameters for debugging
+            print(f"ES URL: {params.url}")
+            print(f"ES User: {params.user}")
+            print(f"ES Password: {params.password}")
+
+    def probe(self) -> bool:
+        if not self.initialization_success:
+            self._connect()
+            return self.initialization_success
+        return self.elastic_vector_search.client.ping()
+
+    @abstractmethod
+    def _build_text(self, entity: Entity, reference: Reference) -> str:
+        """
+        Text of the reference to embed
+        """
+        pass
+
+    def load_reference(self, entity: Entity, reference: Reference):
+        if not self.initialization_success:
+            return
+        identifier = reference.unique_identifier()
+        content_hash = reference.content_hash()
+        if self.content_hashes.is_unchanged(identifier, content_hash,
+                                            lambda: self._stored_content_hash(identifier)):
+            return
+        text = self._build_text(entity, reference)
+        metadata = reference.dict() | {"id": identifier, "content_hash": content_hash}
+        # embedded first : es.index only covers the request to ES
+        with span("embedding", text_length=len(text)):
+            vector = self.embeddings.embed_documents([text])[0]
+        with span("es.index", index=self.ES_INDEX, text_length=len(text)):
+            self.elastic_vector_search.add_embeddings([(text, vector)], ids=[identifier], metadatas=[metadata])
+        self.content_hashes.record_write(identifier, content_hash)
+
+    def _stored_content_hash(self, identifier: str):
+        try:
+            with span("es.get", index=self.ES_INDEX):
+                document = self.elastic_vector_search.client.get(index=self.ES_INDEX, id=identifier,
+                                                                 source_includes=["metadata.content_hash"])
+        except NotFoundError:
+            return None
+        return document["_source"].get("metadata", {}).get("content_hash")
+
+    def _search_hits(self, text: str, reference: Reference = None) -> List[dict]:
+        """
+        Approximate kNN search, as langchain ElasticsearchStore does,
+        returning only the summary fields of the hits in two-phase retrieval mode.
+
+        Given the reference, the k neighbours are searched among usable candidates only : exclusions and blocking
+        filters are applied while traversing the HNSW graph, and hits under the similarity threshold are dropped by ES
+        """
+        with span("embedding", text_length=len(text)):
+            query_vector = self.embeddings.embed_query(text)
+        with span("es.knn_search", index=self.ES_INDEX, k=self.k) as search_span:
+            knn = {
+                "field": "vector",
+                "query_vector": query_vector,
+                "k": self.k,
+                "num_candidates": self.num_candidates,
+            }
+            if reference is not None:
+                knn["filter"] = {"bool": {"filter": self._blocking_clauses(reference),
+                                          "must_not": self._exclusion_clauses(reference)}}
+                # the score of a cosine similarity s is (1 + s) / 2
+                knn["similarity"] = 2 * self.SIMILARITY_THRESHOLD - 1
+            response = self.elastic_vector_search.client.search(
+                index=self.ES_INDEX,
+                knn=knn,
+                size=self.k,
+                source=self.SUMMARY_FIELDS if self.two_phase_retrieval else ["metadata"],
+            )
+            search_span.set_attribute("hits", len(response["hits"]["hits"]))
+        return response["hits"]["hits"]
+
+    @staticmethod
+    def _summary(hit: dict) -> ReferenceSummary:
+        return ReferenceSummary(**hit["_source"]["metadata"])
+
+    def _hydrate(self, hits: List[dict]) -> Dict[str, Reference]:
+        """
+        Full references of the hits that survived filtering, from the reference store or a single mget
+        in two-phase retrieval mode
+        """
+        if not hits:
+            return {}
+        if not self.two_phase_retrieval:
+            return {hit["_id"]: Reference(**hit["_source"]["metadata"]) for hit in hits}
+        return self._hydrate_from_store({hit["_id"]: self._summary(hit).content_hash for hit in hits}, self._mget)
+
+    def _mget(self, identifiers: List[str]) -> Dict[str, Reference]:
+        with span("es.mget", index=self.ES_INDEX, ids=len(identifiers)):
+            response = self.elastic_vector_search.client.mget(index=self.ES_INDEX, ids=identifiers,
+                                                              source=["metadata"])
+        return {doc["_id"]: Reference(**doc["_source"]["metadata"]) for doc in response["docs"] if doc.get("found")}
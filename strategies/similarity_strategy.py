@@ -1,10 +1,46 @@
+import json
+import os
 from abc import ABC, abstractmethod
-from typing import Tuple, Generator
+from enum import IntEnum
+from typing import Callable, Dict, Tuple, Generator, List, Optional
 
 from commons.models import Entity, Reference
+from commons.reference_store import get_reference_store
+
+# blocking filters, disabled by default : candidates issued more than BLOCKING_ISSUED_YEARS years apart from the
+# reference, or whose document types are all outside the family of the reference ones, are not retrieved
+BLOCKING_ISSUED_YEARS = os.getenv("BLOCKING_ISSUED_YEARS")
+BLOCKING_DOCUMENT_TYPES = os.getenv("BLOCKING_DOCUMENT_TYPES", "false").lower() == "true"
+# families of document type labels, e.g. {"book": ["Book", "Chapter"]} : a label outside any family is its own family
+DOCUMENT_TYPE_FAMILIES = json.loads(os.getenv("BLOCKING_DOCUMENT_TYPE_FAMILIES", "{}"))
+
+
+class CostClass(IntEnum):
+    """
+    Relative cost of a strategy query, used to run the cheapest strategies first
+    """
+    LOW = 1
+    MEDIUM = 2
+    HIGH = 3
+
+
+def document_type_family(labels: set) -> set:
+    family = set(labels)
+    for family_labels in DOCUMENT_TYPE_FAMILIES.values():
+        if labels.intersection(family_labels):
+            family.update(family_labels)
+    return family
 
 
 class SimilarityStrategy(ABC):
+    COST = CostClass.MEDIUM
+    # prefix of the reference fields in the index documents, and suffix of their keyword subfield if any
+    FIELD_PREFIX = ""
+    KEYWORD_SUFFIX = ""
+    # whether hits sharing an identifier with the reference are excluded : syntactic strategies keep them,
+    # as they make the trivial duplicates of the reports
+    EXCLUDE_COMMON_IDENTIFIERS = False
+
     def __init__(self):
         pass
 
@@ -21,6 +57,77 @@ class SimilarityStrategy(ABC):
     def get_name(self) -> str:
         pass
 
+    def probe(self) -> bool:
+        """
+        Check that the strategy backend is reachable, retrying a failed initialization if needed
+        """
+        return getattr(self, "initialization_success", True)
+
+    @staticmethod
+    def _hydrate_from_store(content_hashes: Dict[str, Optional[str]],
+                            fetch: Callable[[List[str]], Dict[str, Reference]]) -> Dict[str, Reference]:
+        """
+        Full references from the local reference store if enabled, fetched from the index otherwise,
+        or when the stored copy is not the indexed version (content hash of the hit)
+        """
+        identifiers = list(content_hashes)
+        store = get_reference_store()
+        if store is None:
+            return fetch(identifiers)
+        references = store.get_many(identifiers, content_hashes)
+        missing = [identifier for identifier in identifiers if identifier not in references]
+        if missing:
+            fetched = fetch(missing)
+            store.put_many(fetched.values())
+            references |= fetched
+        return references
+
+    def _keyword_field(self, name: str) -> str:
+        return f"{self.FIELD_PREFIX}{name}{self.KEYWORD_SUFFIX}"
+
+    def _exclusion_clauses(self, reference: Reference) -> List[dict]:
+        """
+        must_not clauses removing from the hits, in the query itself, what would be discarded afterwards :
+        the reference, and references sharing an identifier with it (see _reference_with_common_identifier)
+        if the strategy excludes them.
+        References from the same source (see _identifiers_from_same_source) are matched on substrings
+        of the source identifiers : they are filtered locally
+        """
+        clauses = [{"ids": {"values": [reference.unique_identifier()]}}]
+        if not self.EXCLUDE_COMMON_IDENTIFIERS:
+            return clauses
+        # identifiers are not nested objects : a hit with the type of an identifier and the value of another one
+        # is excluded as well, which the identifier formats make very unlikely
+        for identifier_type, value in {(identifier.type, identifier.value) for identifier in reference.identifiers}:
+            clauses.append({"bool": {"filter": [
+                {"term": {self._keyword_field("identifiers.type"): identifier_type}},
+                {"term": {self._keyword_field("identifiers.value"): value}},
+            ]}})
+        return clauses
+
+    def _blocking_clauses(self, reference: Reference) -> List[dict]:
+        """
+        filter clauses of the enabled blocking filters, hits without the blocking field being kept
+        """
+        clauses = []
+        if BLOCKING_ISSUED_YEARS and reference.issued:
+            years = int(BLOCKING_ISSUED_YEARS)
+            field = f"{self.FIELD_PREFIX}issued"
+            clauses.append(self._or_missing(field, {"range": {field: {
+                "gte": f"{reference.issued.year - years:04d}-01-01",
+                "lt": f"{reference.issued.year + years + 1:04d}-01-01",
+            }}}))
+        labels = {document_type.label for document_type in reference.document_type}
+        if BLOCKING_DOCUMENT_TYPES and labels:
+            field = self._keyword_field("document_type.label")
+            clauses.append(self._or_missing(field, {"terms": {field: sorted(document_type_family(labels))}}))
+        return clauses
+
+    @staticmethod
+    def _or_missing(field: str, clause: dict) -> dict:
+        return {"bool": {"should": [clause, {"bool": {"must_not": {"exists": {"field": field}}}}],
+                         "minimum_should_match": 1}}
+
     def _identifiers_from_same_source(self, reference1: str, reference2: Reference) -> bool:
         """
         Exemple, source identifier of reference1 is 'hal-hal-02954829' and reference2 has "hal-02954829" as source identifier
@@ -1,11 +1,21 @@
-from elasticsearch import Elasticsearch
+import os
+from typing import Dict, List
 
-from commons.es_params import ESParams
-from commons.models import Entity, Reference
+from elasticsearch import NotFoundError
+
+from commons.bulk_indexer import BulkIndexer
+from commons.content_hash_registry import ContentHashRegistry
+from commons.es_params import ESParams, get_es_client
+from commons.models import Entity, Reference, ReferenceSummary
+from commons.tracing import span
 from strategies.similarity_strategy import SimilarityStrategy
 
 
 class SyntacticSimilarityStrategy(SimilarityStrategy):
+    # maximum number of hits per query
+    SEARCH_SIZE = 10
+    # fields needed to filter hits before fetching the full references
+    SUMMARY_FIELDS = ["id", "source_identifier", "identifiers", "titles", "content_hash"]
 
     ES_INDEX_SETTINGS = {
         "analysis": {
@@ -13,6 +23,12 @@ class SyntacticSimilarityStrategy(SimilarityStrategy):
                 "custom_analyzer": {
                     "tokenizer": "keyword",
                     "filter": ["lowercase", "asciifolding", "remove_punctuation", "trim"]
+                },
+                # trigrams of the normalized title, for cheap candidate retrieval before a local edit distance check,
+                # all at the same position : they are searched with one term query each
+                "trigram_analyzer": {
+                    "tokenizer": "keyword",
+                    "filter": ["lowercase", "asciifolding", "remove_punctuation", "trim", "trigrams"]
                 }
             },
             "filter": {
@@ -20,6 +36,11 @@ class SyntacticSimilarityStrategy(SimilarityStrategy):
                     "type": "pattern_replace",
                     "pattern": "[^\\p{L}\\p{Nd}]+",
                     "replacement": ""
+                },
+                "trigrams": {
+                    "type": "ngram",
+                    "min_gram": 3,
+                    "max_gram": 3
                 }
             }
         }
@@ -89,6 +110,9 @@ class SyntacticSimilarityStrategy(SimilarityStrategy):
             "id": {
                 "type": "keyword",
             },
+            "content_hash": {
+                "type": "keyword",
+            },
             "identifiers": {
                 "properties": {
                     "type": {
@@ -176,6 +200,11 @@ class SyntacticSimilarityStrategy(SimilarityStrategy):
                                 "type": "text",
                                 "analyzer": "custom_analyzer",
                                 "search_analyzer": "custom_analyzer"
+                            },
+                            "trigrams": {
+                                "type": "text",
+                                "analyzer": "trigram_analyzer",
+                                "search_analyzer": "trigram_analyzer"
                             }
                         },
                     }
@@ -187,17 +216,22 @@ class SyntacticSimilarityStrategy(SimilarityStrategy):
 
     def __init__(self):
         self.initialization_success = False
+        self.content_hashes = ContentHashRegistry(self.ES_INDEX)
+        # "eventual" : queries may miss documents written less than a refresh interval ago
+        # "strict" : pending documents are flushed and made searchable before each query
+        self.read_after_write = os.getenv("SYNTACTIC_READ_AFTER_WRITE", "eventual")
+        self.two_phase_retrieval = os.getenv("TWO_PHASE_RETRIEVAL", "true").lower() == "true"
+        self._connect()
+
+    def _connect(self):
         params = ESParams()
         try:
-            self.es = Elasticsearch(
-                [params.url],
-                http_auth=(params.user, params.password),
-                verify_certs=False,
-            )
+            self.es = get_es_client()
             if not self.es.indices.exists(index=self.ES_INDEX):
                 self.es.indices.create(index=self.ES_INDEX, mappings=self.ES_INDEX_MAPPING,
                                        settings=self.ES_INDEX_SETTINGS)
-
+            self.content_hashes.bind(self.es)
+            self.indexer = BulkIndexer(self.es, self.ES_INDEX)
             self.initialization_success = True
         except Exception as e:
             print(f"Error connecting to ES: {e}")
@@ -206,6 +240,12 @@ class SyntacticSimilarityStrategy(SimilarityStrategy):
             print(f"ES User: {params.user}")
             print(f"ES Password: {params.password}")
 
+    def probe(self) -> bool:
+        if not self.initialization_success:
+            self._connect()
+            return self.initialization_success
+        return self.es.ping()
+
     def load_reference(self, entity: Entity, reference: Reference):
         """
         Add the reference to the elastic search index
@@ -213,6 +253,65 @@ class SyntacticSimilarityStrategy(SimilarityStrategy):
         if not self.initialization_success:
             return
         identifier = reference.unique_identifier()
+        content_hash = reference.content_hash()
+        if self.content_hashes.is_unchanged(identifier, content_hash,
+                                            lambda: self._stored_content_hash(identifier)):
+            return
         reference.compute_last_names()
-        metadata = reference.dict() | {"id": identifier}
-        self.es.index(index=self.ES_INDEX, id=identifier, body=metadata)
+        metadata = reference.dict() | {"id": identifier, "content_hash": content_hash}
+        self.indexer.add(identifier, metadata,
+                         on_indexed=lambda: self.content_hashes.record_write(identifier, content_hash))
+
+    def _ensure_read_after_write(self):
+        if self.read_after_write == "strict":
+            self.indexer.flush(refresh="wait_for")
+
+    def _stored_content_hash(self, identifier: str):
+        try:
+            with span("es.get", index=self.ES_INDEX):
+                document = self.es.get(index=self.ES_INDEX, id=identifier, source_includes=["content_hash"])
+        except NotFoundError:
+            return None
+        return document["_source"].get("content_hash")
+
+    def _search_hits(self, query: dict, size: int = None) -> List[dict]:
+        """
+        Search the index, returning only the summary fields of the hits in two-phase retrieval mode
+        """
+        body = query | {"size": size or self.SEARCH_SIZE,
+                        "_source": self.SUMMARY_FIELDS if self.two_phase_retrieval else True}
+        with span("es.search", index=self.ES_INDEX, size=body["size"]) as search_span:
+            hits = self.es.search(index=self.ES_INDEX, body=body)["hits"]["hits"]
+            search_span.set_attribute("hits", len(hits))
+        return hits
+
+    def _candidate_query(self, query: dict, reference: Reference) -> dict:
+        """
+        The query restricted to usable candidates of the reference : exclusions and blocking filters
+        do not change the scores, but hits that would be discarded afterwards no longer take the first places
+        """
+        return query | {"query": {"bool": {
+            "must": query["query"],
+            "filter": self._blocking_clauses(reference),
+            "must_not": self._exclusion_clauses(reference),
+        }}}
+
+    @staticmethod
+    def _summary(hit: dict) -> ReferenceSummary:
+        return ReferenceSummary(**hit["_source"])
+
+    def _hydrate(self, hits: List[dict]) -> Dict[str, Reference]:
+        """
+        Full references of the hits that survived filtering, from the reference store or a single mget
+        in two-phase retrieval mode
+        """
+        if not hits:
+            return {}
+        if not self.two_phase_retrieval:
+            return {hit["_id"]: Reference(**hit["_source"]) for hit in hits}
+        return self._hydrate_from_store({hit["_id"]: self._summary(hit).content_hash for hit in hits}, self._mget)
+
+    def _mget(self, identifiers: List[str]) -> Dict[str, Reference]:
+        with span("es.mget", index=self.ES_INDEX, ids=len(identifiers)):
+            response = self.es.mget(index=self.ES_INDEX, ids=identifiers)
+        return {doc["_id"]: Reference(**doc["_source"]) for doc in response["docs"] if doc.get("found")}
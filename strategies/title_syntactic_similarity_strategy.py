@@ -1,21 +1,68 @@
-from typing import Generator
+import os
+import unicodedata
+from typing import Generator, List
 
+from commons.edit_distance import bounded_levenshtein
 from commons.models import Entity, Reference, Result
-from strategies.common_titles import common_titles
+from commons.tracing import span
+from strategies.common_titles import CommonTitleStoplist, common_titles
+from strategies.similarity_strategy import CostClass
 from strategies.synctactic_similarity_strategy import SyntacticSimilarityStrategy
 
 
 class TitleSyntacticSimilarityStrategy(SyntacticSimilarityStrategy):
+    COST = CostClass.LOW
     ES_INDEX = "title_syntactic_1"
     LEVENSHTEIN_THRESHOLD = 2
     MEANINGLESS_TITLES = []
     MIN_MEANINGFUL_TITLE_LENGTH = 12
+    SEARCH_SIZE = int(os.getenv("TITLE_SYNTACTIC_SEARCH_SIZE", 10))
+    # "fuzzy" : ES fuzzy query on the normalized title
+    # "ngram" : trigram match on the titles.value.trigrams subfield, then local edit distance check,
+    # counting adjacent transpositions as one edit like the fuzzy query.
+    # Indexes created before the subfield existed fall back to "fuzzy"
+    RETRIEVAL_MODE = os.getenv("TITLE_SYNTACTIC_RETRIEVAL", "fuzzy")
+    NGRAM_SIZE = 3
+    # number of trigram candidates checked locally for each title
+    NGRAM_SEARCH_SIZE = int(os.getenv("TITLE_NGRAM_SEARCH_SIZE", 50))
 
     def __init__(self):
+        # titles too frequent in the index to be searched without author names, built once connected
+        self.title_stoplist = None
+        # checked against the index mapping once connected
+        self.retrieval_mode = self.RETRIEVAL_MODE
         super().__init__()
         # if the composite approach (with author names) has been used
         self.composite = False
 
+    def _connect(self):
+        # also called by probe, when the initial connection failed
+        super()._connect()
+        if self.initialization_success and self.retrieval_mode == "ngram":
+            try:
+                has_trigram_subfield = self._has_trigram_subfield()
+            except Exception as e:
+                print(f"Error reading the mapping of {self.ES_INDEX}: {e}")
+                has_trigram_subfield = False
+            if not has_trigram_subfield:
+                print(f"Index {self.ES_INDEX} has no titles.value.trigrams subfield (created before it was added "
+                      f"to the mapping) : falling back to fuzzy title retrieval, reindex to use the ngram mode")
+                self.retrieval_mode = "fuzzy"
+        if self.initialization_success and self.title_stoplist is None:
+            self.title_stoplist = CommonTitleStoplist(self.es, self.ES_INDEX)
+            self.title_stoplist.start_refreshing()
+
+    def _has_trigram_subfield(self) -> bool:
+        with span("es.get_mapping", index=self.ES_INDEX):
+            response = self.es.indices.get_mapping(index=self.ES_INDEX)
+        # the response is keyed by the concrete index name, which differs from ES_INDEX behind an alias
+        for index in response:
+            title_value = response[index]["mappings"].get("properties", {}).get("titles", {}) \
+                .get("properties", {}).get("value", {})
+            if "trigrams" not in title_value.get("fields", {}):
+                return False
+        return True
+
     def get_similar_references(
             self, entity: Entity, reference: Reference
     ) -> Generator[Result, None, None]:
@@ -24,6 +71,7 @@ class TitleSyntacticSimilarityStrategy(SyntacticSimilarityStrategy):
         """
         if not self.initialization_success:
             return
+        self._ensure_read_after_write()
         identifier = reference.unique_identifier()
         reference.compute_last_names()
         source_identifier = reference.source_identifier
@@ -33,32 +81,43 @@ class TitleSyntacticSimilarityStrategy(SyntacticSimilarityStrategy):
         for title in title_values:
             title_length = len(title)
 
-            analyze_response = self.es.indices.analyze(
-                index=self.ES_INDEX,
-                body={
-                    "analyzer": "custom_analyzer",
-                    "text": title
-                }
-            )
+            with span("es.analyze", index=self.ES_INDEX):
+                analyze_response = self.es.indices.analyze(
+                    index=self.ES_INDEX,
+                    body={
+                        "analyzer": "custom_analyzer",
+                        "text": title
+                    }
+                )
             analyzed_title = analyze_response['tokens'][0]['token']
-            if self._title_is_meaning_less(title, analyzed_title):
+            if self.title_stoplist is not None and title in self.title_stoplist:
+                # frequent titles are only searched together with author names
+                if not reference.contributions:
+                    continue
+                composite = True
+                query = self.title_authors_query(analyzed_title, reference.contributions)
+            elif self._title_is_meaning_less(title, analyzed_title):
                 composite = True
                 query = self.title_authors_query(analyzed_title, reference.contributions)
             else:
                 query = self.title_only_query(analyzed_title)
+            query = self._candidate_query(query, reference)
 
-        raw_result = self.es.search(index=self.ES_INDEX, body=query)
-        raw_results = raw_result["hits"]["hits"]
-        # eclude : ScanR : halhalshs-00511995,	HAL : halshs-00511995
-        # exclude all results where source identifier  is contained in the reference source identifier
-        raw_results = [result for result in raw_results if
-                       source_identifier not in result["_source"]["source_identifier"]]
-        # exclude all results where source identifier contains reference source identifier
-        raw_results = [result for result in raw_results if
-                       result["_source"]["source_identifier"] not in source_identifier]
-        # exclude all results where unique identifier is the same as the reference unique identifier
-        raw_results = [result for result in raw_results if result["_id"] != identifier]
-        query_results.append(raw_results)
+            if self._uses_ngrams(analyzed_title):
+                raw_results = self._within_levenshtein_threshold(title,
+                                                                 self._search_hits(query, self.NGRAM_SEARCH_SIZE))
+            else:
+                raw_results = self._search_hits(query)
+            # eclude : ScanR : halhalshs-00511995,	HAL : halshs-00511995
+            # exclude all results where source identifier  is contained in the reference source identifier
+            raw_results = [result for result in raw_results if
+                           source_identifier not in result["_source"]["source_identifier"]]
+            # exclude all results where source identifier contains reference source identifier
+            raw_results = [result for result in raw_results if
+                           result["_source"]["source_identifier"] not in source_identifier]
+            # exclude all results where unique identifier is the same as the reference unique identifier
+            raw_results = [result for result in raw_results if result["_id"] != identifier]
+            query_results.append(raw_results)
 
         # flatten the list of lists
         query_results = [item for sublist in query_results for item in sublist]
@@ -71,14 +130,19 @@ class TitleSyntacticSimilarityStrategy(SyntacticSimilarityStrategy):
                 deduplicated_results_hash[result["_id"]] = result
         deduplicated_results = deduplicated_results_hash.values()
         # if both document titles and reference titles are in common_titles, the similarity is not relevant : filter the document out
+        relevant_results = []
         for result in deduplicated_results:
-            reference2 = Reference(**{**result["_source"]})
             # concatenate all string titles from ref1 and ref2
-            str_titles = [title.value for title in reference.titles] + [title.value for title in reference2.titles]
-            if common_titles(str_titles):
+            str_titles = [title.value for title in reference.titles] + \
+                         [title.value for title in self._summary(result).titles]
+            if not common_titles(str_titles):
+                relevant_results.append(result)
+        references = self._hydrate(relevant_results)
+        for result in relevant_results:
+            if result["_id"] not in references:
                 continue
             yield Result(reference1=reference,
-                         reference2=reference2,
+                         reference2=references[result["_id"]],
                          scores=[result["_score"]],
                          similarity_strategies=[self.get_name()]
                          )
@@ -94,10 +158,47 @@ class TitleSyntacticSimilarityStrategy(SyntacticSimilarityStrategy):
 
     def title_only_query(self, analyzed_title):
         query = {
-            "query": self.fuzzy_title_query_block(analyzed_title)
+            "query": self.title_query_block(analyzed_title)
         }
         return query
 
+    def _uses_ngrams(self, analyzed_title):
+        return self.retrieval_mode == "ngram" and len(analyzed_title) >= self.NGRAM_SIZE
+
+    def title_query_block(self, analyzed_title):
+        if self._uses_ngrams(analyzed_title):
+            return self.ngram_title_query_block(analyzed_title)
+        return self.fuzzy_title_query_block(analyzed_title)
+
+    def ngram_title_query_block(self, analyzed_title):
+        trigrams = {analyzed_title[i:i + self.NGRAM_SIZE] for i in range(len(analyzed_title) - self.NGRAM_SIZE + 1)}
+        # each edit removes at most NGRAM_SIZE trigrams, NGRAM_SIZE + 1 for a transposition :
+        # titles within the threshold share at least this many
+        minimum_should_match = max(1, len(trigrams) - self.LEVENSHTEIN_THRESHOLD * (self.NGRAM_SIZE + 1))
+        # one term query per trigram : the trigrams of the subfield share the same position, so a match query
+        # would be rewritten as a synonym query, ignoring minimum_should_match
+        return {
+            "bool": {
+                "should": [{"term": {"titles.value.trigrams": trigram}} for trigram in sorted(trigrams)],
+                "minimum_should_match": minimum_should_match
+            }
+        }
+
+    @staticmethod
+    def analyze_title(title: str) -> str:
+        """
+        Local equivalent of custom_analyzer : lowercase, accents and punctuation removed
+        """
+        return "".join(char for char in unicodedata.normalize("NFKD", title.lower()) if char.isalnum())
+
+    def _within_levenshtein_threshold(self, title: str, hits: List[dict]) -> List[dict]:
+        analyzed_title = self.analyze_title(title)
+        return [hit for hit in hits
+                if any(bounded_levenshtein(analyzed_title, self.analyze_title(hit_title.value),
+                                           self.LEVENSHTEIN_THRESHOLD, transpositions=True)
+                       <= self.LEVENSHTEIN_THRESHOLD
+                       for hit_title in self._summary(hit).titles)]
+
     def fuzzy_title_query_block(self, analyzed_title):
         return {
             "fuzzy": {
@@ -119,7 +220,7 @@ class TitleSyntacticSimilarityStrategy(SyntacticSimilarityStrategy):
             "query": {
                 "bool": {
                     "must": [
-                        self.fuzzy_title_query_block(analyzed_title),
+                        self.title_query_block(analyzed_title),
                         {
                             "bool": {
                                 "should": authors_match_block,
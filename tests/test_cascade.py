@@ -0,0 +1,83 @@
+from unittest import mock
+
+from commons.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from strategies.cascade import StrategyCascade
+from strategies.similarity_strategy import CostClass
+from tests.test_duplicate_detector import reference
+
+
+class Strategy:
+    COST = CostClass.LOW
+    initialization_success = True
+
+    def __init__(self):
+        self.available = True
+        self.loaded = []
+
+    def load_reference(self, entity, reference):
+        if not self.available:
+            raise ConnectionError("unavailable")
+        self.loaded.append(reference.source_identifier)
+
+    def get_similar_references(self, entity, reference):
+        return []
+
+
+def cascade(strategy: Strategy) -> StrategyCascade:
+    registry = mock.Mock()
+    registry.items.return_value = [("stage", strategy)]
+    return StrategyCascade(registry, rules=[])
+
+
+def wait_for_stage(cascade: StrategyCascade) -> None:
+    cascade._executor("stage").submit(lambda: None).result()
+
+
+def test_half_open_breaker_admits_a_single_trial_call():
+    breaker = CircuitBreaker("stage", failure_threshold=1)
+    breaker.record_failure()
+    breaker.probe_succeeded()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    breaker.probe_succeeded()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success(0)
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_references_refused_by_an_open_breaker_are_loaded_once_it_closes():
+    strategy = Strategy()
+    strategy_cascade = cascade(strategy)
+    breaker = strategy_cascade._breaker("stage")
+    strategy.available = False
+    for index in range(breaker.failure_threshold):
+        assert strategy_cascade.run(None, reference(index)) == ([], ["stage"])
+    assert breaker.state == OPEN
+    strategy_cascade.run(None, reference(3))
+    strategy_cascade.run(None, reference(4))
+    assert strategy_cascade.stats()["stage"]["deferred_loads"] == 5
+    strategy.available = True
+    breaker.probe_succeeded()
+    assert strategy_cascade.run(None, reference(5)) == ([], [])
+    wait_for_stage(strategy_cascade)
+    assert strategy.loaded == ["ref-5", "ref-0", "ref-1", "ref-2", "ref-3", "ref-4"]
+    assert strategy_cascade.stats()["stage"]["deferred_loads"] == 0
+
+
+def test_deferred_loads_are_loaded_by_batches():
+    strategy = Strategy()
+    strategy_cascade = cascade(strategy)
+    strategy_cascade.deferred_loads_batch = 2
+    for index in range(5):
+        strategy_cascade._defer_load("stage", None, reference(index))
+    strategy_cascade.run(None, reference(5))
+    wait_for_stage(strategy_cascade)
+    assert strategy.loaded == ["ref-5", "ref-0", "ref-1"]
+    strategy_cascade.run(None, reference(6))
+    wait_for_stage(strategy_cascade)
+    assert strategy.loaded == ["ref-5", "ref-0", "ref-1", "ref-6", "ref-2", "ref-3"]
@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from benchmarks.duplicate_detector_benchmark import random_reference
+from commons.models import Reference
+from simple_duplicate_detector import BatchDuplicateDetector, SimpleDuplicateDetector
+
+
+def reference(index: int, title: str = "Deep learning for retrieval", names=("John Smith",), identifiers=(),
+              manifestations=(), abstracts=(), document_types=(), book=None) -> Reference:
+    return Reference(
+        source_identifier=f"ref-{index}",
+        harvester="hal",
+        identifiers=[{"type": type, "value": value} for type, value in identifiers],
+        manifestations=[{"page": page} for page in manifestations],
+        titles=[{"value": title, "language": None}],
+        subtitles=[],
+        abstracts=[{"value": abstract, "language": None} for abstract in abstracts],
+        subjects=[],
+        document_type=[{"uri": label, "label": label} for label in document_types],
+        contributions=[{"rank": rank, "role": "Author",
+                        "contributor": {"source": "s", "source_identifier": None, "name": name,
+                                        "name_variants": []}}
+                       for rank, name in enumerate(names)],
+        book=book,
+    )
+
+
+REFERENCE = reference(0, identifiers=[("doi", "10.1/ABC"), ("uri", "http://a.org/x/id")],
+                      manifestations=["http://a.org/page"], abstracts=["An abstract."], document_types=["Article"],
+                      book={"isbn13": "978-2-07", "isbn10": None})
+
+CANDIDATES = {
+    "same doi with prefix": reference(1, title="Other", identifiers=[("doi", "https://doi.org/10.1/abc")]),
+    "same isbn with spaces": reference(2, title="Other", book={"isbn13": " 978-2-07 "}),
+    "same uri without trailing id": reference(3, title="Other", manifestations=["http://A.org/x"]),
+    "same title and contributors": reference(4, title="Deep Learning for Retrieval !", names=["Jöhn Smith"]),
+    "different title": reference(5, title="Histoire de l'Europe"),
+    "different contributors": reference(6, names=["John Smith", "Marie Curie"]),
+    "different abstract": reference(7, abstracts=["Un résumé."]),
+    "no abstract": reference(8),
+    "common document type": reference(9, document_types=["Book", "Article"]),
+    "other document type": reference(10, document_types=["Book"]),
+    "other isbn10 only": reference(11, title="Other", book={"isbn10": "2-07"}),
+}
+
+
+@pytest.mark.parametrize("name", CANDIDATES)
+def test_batch_verdict_matches_pairwise_verdict(name):
+    candidate = CANDIDATES[name]
+    expected = bool(SimpleDuplicateDetector(REFERENCE, candidate).is_duplicate())
+    assert BatchDuplicateDetector(REFERENCE).are_duplicates([candidate]) == [expected]
+
+
+def test_batch_verdicts_match_pairwise_verdicts_in_one_batch():
+    candidates = list(CANDIDATES.values())
+    expected = [bool(SimpleDuplicateDetector(REFERENCE, candidate).is_duplicate()) for candidate in candidates]
+    assert BatchDuplicateDetector(REFERENCE).are_duplicates(candidates) == expected
+    assert any(expected) and not all(expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_verdicts_match_pairwise_verdicts_on_random_references(seed):
+    rng = random.Random(seed)
+    reference = random_reference(rng, -1)
+    candidates = [random_reference(rng, index) for index in range(200)]
+    expected = [bool(SimpleDuplicateDetector(reference, candidate).is_duplicate()) for candidate in candidates]
+    assert BatchDuplicateDetector(reference).are_duplicates(candidates) == expected
+
+
+def test_no_candidates():
+    assert BatchDuplicateDetector(REFERENCE).are_duplicates([]) == []
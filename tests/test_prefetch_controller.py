@@ -0,0 +1,70 @@
+import asyncio
+import time
+from unittest import mock
+
+from commons.tracing import tracer
+from prefetch_controller import PrefetchController
+from strategies.title_semantic_similarity_strategy import TitleSemanticSimilarityStrategy
+
+
+class SlowEmbeddings:
+    def __init__(self, duration: float):
+        self.duration = duration
+
+    def embed_documents(self, texts):
+        time.sleep(self.duration)
+        return [[0.0] * 3 for _ in texts]
+
+
+class SlowEmbeddingStrategy(TitleSemanticSimilarityStrategy):
+    def __init__(self, embedding_duration: float):
+        # not connected : writes go to a mocked vector store answering at once
+        self.embeddings = SlowEmbeddings(embedding_duration)
+        self.initialization_success = True
+        self.content_hashes = mock.Mock()
+        self.content_hashes.is_unchanged.return_value = False
+        self.elastic_vector_search = mock.Mock()
+
+    def _build_text(self, entity, reference) -> str:
+        return "title"
+
+
+def reference(index: int):
+    reference = mock.Mock()
+    reference.unique_identifier.return_value = f"ref-{index}"
+    reference.content_hash.return_value = "hash"
+    reference.dict.return_value = {}
+    return reference
+
+
+def adjust(controller: PrefetchController, processing_times) -> None:
+    async def record():
+        for processing_time in processing_times:
+            await controller.record(processing_time)
+    asyncio.run(record())
+
+
+def test_slow_embedding_does_not_reduce_prefetch():
+    tracer.collect_es_latencies()
+    strategy = SlowEmbeddingStrategy(embedding_duration=0.05)
+    controller = PrefetchController(mock.AsyncMock(), initial=10, maximum=100, adjust_interval=0,
+                                    es_latency_budget=0.01, max_wait=100.0)
+    for index in range(3):
+        strategy.load_reference(None, reference(index))
+    strategy.elastic_vector_search.add_embeddings.assert_called()
+    adjust(controller, [0.05])
+    assert controller.last_decision["es_requests"] == 3
+    assert controller.last_decision["reason"] == "healthy"
+    assert controller.prefetch_count == 11
+
+
+def test_slow_es_requests_halve_prefetch():
+    tracer.collect_es_latencies()
+    strategy = SlowEmbeddingStrategy(embedding_duration=0)
+    strategy.elastic_vector_search.add_embeddings.side_effect = lambda *args, **kwargs: time.sleep(0.05)
+    controller = PrefetchController(mock.AsyncMock(), initial=10, maximum=100, adjust_interval=0,
+                                    es_latency_budget=0.01, max_wait=100.0)
+    strategy.load_reference(None, reference(0))
+    adjust(controller, [0.05])
+    assert controller.last_decision["reason"] == "es_latency"
+    assert controller.prefetch_count == 5
@@ -0,0 +1,95 @@
+import asyncio
+from unittest import mock
+
+from commons.models import Entity
+from reports.author_report_builder import AuthorReportBuilder
+from reports.report_writer import ReportWriter
+from tests.test_duplicate_detector import reference
+
+
+class Builder:
+    def __init__(self, report: str, failures: int = 0):
+        self.report = report
+        self.failures = failures
+
+    def render_report(self) -> str:
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("render failed")
+        return self.report
+
+
+def run_periodic_flushes(writer: ReportWriter, flushes: int) -> None:
+    async def run():
+        task = asyncio.create_task(writer.flush_periodically())
+        await asyncio.sleep(writer.flush_interval * (flushes + 0.5))
+        task.cancel()
+    asyncio.run(run())
+
+
+def test_failed_write_is_retried_at_next_flush(tmp_path):
+    writer = ReportWriter(str(tmp_path), flush_interval=0.05)
+    writer.mark_dirty("author", Builder("report"))
+    with mock.patch.object(writer.fs, "mv", side_effect=OSError("disk full")):
+        writer.flush()
+    assert writer.pending == 1
+    writer.flush()
+    assert writer.pending == 0
+    assert (tmp_path / "author.txt").read_text() == "report"
+
+
+def test_periodic_flush_survives_a_failed_flush(tmp_path):
+    writer = ReportWriter(str(tmp_path), flush_interval=0.05)
+    writer.mark_dirty("author", Builder("report"))
+    writer.mark_dirty("other", Builder("other report"))
+    write = writer.write
+    calls = []
+
+    def write_failing_once(reports):
+        calls.append(reports)
+        if len(calls) == 1:
+            raise OSError("permission denied")
+        return write(reports)
+
+    writer.write = write_failing_once
+    run_periodic_flushes(writer, 3)
+    assert len(calls) == 2
+    assert (tmp_path / "author.txt").read_text() == "report"
+    assert (tmp_path / "other.txt").read_text() == "other report"
+    assert writer.pending == 0
+
+
+def test_periodic_flush_survives_a_failed_render(tmp_path):
+    writer = ReportWriter(str(tmp_path), flush_interval=0.05)
+    writer.mark_dirty("author", Builder("report", failures=1))
+    writer.mark_dirty("other", Builder("other report"))
+    run_periodic_flushes(writer, 3)
+    assert (tmp_path / "author.txt").read_text() == "report"
+    assert (tmp_path / "other.txt").read_text() == "other report"
+    assert writer.pending == 0
+
+
+def test_reports_of_split_lanes_are_merged(tmp_path):
+    entity = Entity(identifiers=[{"type": "idref", "value": "123"}], name="John Smith")
+    main_builder = AuthorReportBuilder(entity)
+    main_builder.add_reference(reference(1, title="Processed by the main lane"))
+    slow_builder = AuthorReportBuilder(entity)
+    slow_builder.add_reference(reference(2, title="Processed by the slow lane"))
+    slow_builder.add_potential_reference(reference(3, title="Potential reference"))
+    slow_builder.add_potential_duplicate(reference(2), reference(3))
+    main_writer = ReportWriter(str(tmp_path), lane="main")
+    slow_writer = ReportWriter(str(tmp_path), lane="slow")
+    main_writer.mark_dirty("123", main_builder)
+    main_writer.flush()
+    slow_writer.mark_dirty("123", slow_builder)
+    slow_writer.flush()
+    report = (tmp_path / "123.txt").read_text()
+    for title in ("Processed by the main lane", "Processed by the slow lane", "Potential reference"):
+        assert title in report
+    # written again by the main lane, the report keeps the references of the slow lane
+    main_builder.add_reference(reference(4, title="Processed later by the main lane"))
+    main_writer.mark_dirty("123", main_builder)
+    main_writer.flush()
+    report = (tmp_path / "123.txt").read_text()
+    for title in ("Processed later by the main lane", "Processed by the slow lane"):
+        assert title in report
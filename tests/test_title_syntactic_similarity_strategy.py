@@ -0,0 +1,62 @@
+import random
+from unittest import mock
+
+import pytest
+
+from commons.edit_distance import bounded_levenshtein
+from strategies.synctactic_similarity_strategy import SyntacticSimilarityStrategy
+from strategies.title_syntactic_similarity_strategy import TitleSyntacticSimilarityStrategy
+
+
+def edit_distance(a: str, b: str, transpositions: bool) -> int:
+    rows = [[i + j if i == 0 or j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            rows[i][j] = min(rows[i - 1][j] + 1, rows[i][j - 1] + 1, rows[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if transpositions and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                rows[i][j] = min(rows[i][j], rows[i - 2][j - 2] + 1)
+    return rows[len(a)][len(b)]
+
+
+def test_swapped_letters_count_as_one_edit_like_the_fuzzy_query():
+    assert bounded_levenshtein("retrieval", "retreival", 2) == 2
+    assert bounded_levenshtein("retrieval", "retreival", 2, transpositions=True) == 1
+    assert bounded_levenshtein("retrieval", "rteriveal", 2) == 3
+    assert bounded_levenshtein("retrieval", "rteriveal", 2, transpositions=True) == 2
+
+
+@pytest.mark.parametrize("transpositions", [False, True])
+def test_bounded_distance_matches_full_distance(transpositions):
+    rng = random.Random(0)
+    for _ in range(2000):
+        a = "".join(rng.choice("abc") for _ in range(rng.randint(0, 8)))
+        b = "".join(rng.choice("abc") for _ in range(rng.randint(0, 8)))
+        max_distance = rng.randint(0, 3)
+        expected = min(edit_distance(a, b, transpositions), max_distance + 1)
+        assert min(bounded_levenshtein(a, b, max_distance, transpositions), max_distance + 1) == expected
+
+
+def connected_strategy(mapping: dict) -> TitleSyntacticSimilarityStrategy:
+    es = mock.Mock()
+    es.indices.get_mapping.return_value = {"title_syntactic_1": {"mappings": mapping}}
+    with mock.patch("strategies.synctactic_similarity_strategy.get_es_client", return_value=es), \
+            mock.patch("strategies.synctactic_similarity_strategy.ContentHashRegistry"), \
+            mock.patch("strategies.synctactic_similarity_strategy.BulkIndexer"), \
+            mock.patch("strategies.title_syntactic_similarity_strategy.CommonTitleStoplist"), \
+            mock.patch.object(TitleSyntacticSimilarityStrategy, "RETRIEVAL_MODE", "ngram"):
+        return TitleSyntacticSimilarityStrategy()
+
+
+def test_ngram_mode_is_kept_when_the_index_has_the_trigram_subfield():
+    strategy = connected_strategy(SyntacticSimilarityStrategy.ES_INDEX_MAPPING)
+    assert strategy.initialization_success
+    assert strategy.retrieval_mode == "ngram"
+
+
+def test_index_without_trigram_subfield_falls_back_to_fuzzy():
+    mapping = {"properties": {"titles": {"properties": {"value": {"type": "text", "fields": {
+        "normalized": {"type": "text", "analyzer": "custom_analyzer"}}}}}}}
+    strategy = connected_strategy(mapping)
+    assert strategy.initialization_success
+    assert strategy.retrieval_mode == "fuzzy"
+    assert "fuzzy" in strategy.title_query_block("deeplearningforretrieval")